@@ -1,34 +1,53 @@
-import os, json, glob, pandas as pd, matplotlib.pyplot as plt
-from benchmark.evaluate import classify_response, evaluate_results
+import os, json, glob, datetime, pandas as pd
+from benchmark.evaluate import evaluate_results
+from metrics.charts import render
+
+SUMMARY_COLUMNS = ["classification", "tox_label", "toxicity", "tox_tier"]
 
 def summarize(csv_path):
-    df = pd.read_csv(csv_path)
-    if "classification" not in df.columns:
-        df["classification"] = df["response"].apply(classify_response)
-        df.to_csv(csv_path, index=False)
-    # ensure toxicity columns exist
-    df = evaluate_results(csv_path)
+    # evaluate_results adds classification and toxicity; an up-to-date file is
+    # read for its fingerprints and the summary columns only.
+    # TOX_CASCADE: path of a calibrated benchmark.tox_cascade model (optional)
+    df = evaluate_results(csv_path, tox_cascade=os.getenv("TOX_CASCADE") or None, columns=SUMMARY_COLUMNS)
 
     counts = df["classification"].value_counts().to_dict()
     tox_counts = df["tox_label"].value_counts(dropna=False).to_dict()
     mean_tox = float(df["toxicity"].dropna().mean()) if "toxicity" in df else None
-    return {"counts": counts, "toxicity": {"counts": tox_counts, "mean": mean_tox}}
+    out = {"counts": counts, "toxicity": {"counts": tox_counts, "mean": mean_tox}}
+    if "tox_tier" in df and df["tox_tier"].eq("lexical").any():
+        out["toxicity"]["tiers"] = {str(k): int(v) for k, v in df["tox_tier"].value_counts().items()}
+    return out
 
 def chart_from_counts(counts, title, out_png):
-    s = pd.Series(counts)
-    ax = s.plot(kind="bar", title=title)
-    ax.set_xlabel("class"); ax.set_ylabel("count")
-    plt.tight_layout(); plt.savefig(out_png); plt.close()
+    # drawn later by metrics.charts.render, and only if the counts changed
+    return (out_png, "bar_counts", {str(k): int(v) for k, v in counts.items()}, {"title": title})
+
+def load_previous(path="results/summary_all.json"):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
 
 def main():
     os.makedirs("results", exist_ok=True)
-    outputs = sorted(glob.glob("results/*_outputs.csv"))
-    summary_all = {}
+    outputs = sorted(glob.glob("results/*_outputs.csv") + glob.glob("results/*_outputs.parquet"))
+    previous = load_previous()
+    summary_all, charts = {}, []
+    # metrics/compute_metrics.py records the summary under this date
+    evaluated = datetime.datetime.utcnow().strftime("%Y-%m-%d")
     for csv in outputs:
-        model = os.path.basename(csv).replace("_outputs.csv","")
+        model = os.path.basename(csv).rsplit("_outputs.", 1)[0]
         s = summarize(csv)
+        s["evaluated"] = evaluated
+        # run_benchmark --adaptive writes its stratified estimates here; keep
+        # them while they still describe this outputs file
+        adaptive = previous.get(model, {}).get("adaptive")
+        if adaptive and adaptive.get("prompts_evaluated") == sum(s["counts"].values()):
+            s["adaptive"] = adaptive
         summary_all[model] = s
-        chart_from_counts(s["counts"], f"Safety Summary ({model})", f"results/{model}_summary.png")
+        charts.append(chart_from_counts(s["counts"], f"Safety Summary ({model})", f"results/{model}_summary.png"))
+    render(charts)
 
     # comparison table & json
     models = sorted(summary_all.keys())
@@ -0,0 +1,180 @@
+# benchmark/adaptive.py
+# Adaptive stratified sampling: estimate per-stratum classification rates to
+# a target precision instead of generating every prompt.
+#
+# Prompts are grouped into strata by the collector columns (category and
+# source by default) and each stratum is visited in a seeded random order.
+# Batches are drawn round-robin from the strata still open; as results come
+# in, a Wilson interval is kept for every tracked rate (unsafe, refusal) of
+# every stratum, and a stratum closes once all of its intervals are narrower
+# than `target_width` (after `min_per_stratum` draws) or it runs out of
+# prompts.
+#
+# Population estimates weight each stratum by its size. Their intervals
+# combine the per-stratum Wilson half-widths (as standard errors, with the
+# finite population correction), which stays conservative for strata whose
+# observed rate is 0. The stopping rule only looks at interval width, not at
+# the estimate itself, but intervals are still checked after every batch,
+# so treat them as approximate at the nominal confidence.
+
+import math, random
+from statistics import NormalDist
+
+CLASSES = ("safe", "refusal", "unsafe")
+TRACKED = ("unsafe", "refusal")
+
+def z_for(confidence):
+    return NormalDist().inv_cdf(0.5 + confidence / 2)
+
+def wilson(k, n, z):
+    """Wilson score interval for k successes out of n -> (lo, hi)."""
+    if n == 0:
+        return 0.0, 1.0
+    p = k / n
+    denom = 1 + z * z / n
+    centre = (p + z * z / (2 * n)) / denom
+    half = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / denom
+    return max(0.0, centre - half), min(1.0, centre + half)
+
+def _key_of(row, cols):
+    return tuple("unknown" if v is None or (isinstance(v, float) and math.isnan(v)) else str(v)
+                 for v in (row[c] for c in cols))
+
+class _Stratum:
+    def __init__(self, key, indices):
+        self.key = key
+        self.order = indices     # shuffled; drawn from the front
+        self.N = len(indices)
+        self.issued = 0
+        self.counts = {c: 0 for c in CLASSES}
+        self.n = 0
+        self.closed = None       # reason, once closed
+
+    def intervals(self, z):
+        return {c: wilson(self.counts.get(c, 0), self.n, z) for c in self.counts}
+
+class AdaptiveSampler:
+    """Stratified sequential sampler over a prompt table.
+
+    `frame` is the prompt DataFrame; `strata` the columns to stratify on
+    (missing columns are ignored; with none left everything is one stratum).
+    Call next_batch() for prompt indices to generate, record() each result's
+    classification, and summary() for the estimates.
+    """
+
+    def __init__(self, frame, strata=("category", "source"), target_width=0.1, confidence=0.95,
+                 min_per_stratum=20, seed=0, tracked=TRACKED):
+        self.strata_cols = [c for c in strata if c in frame.columns]
+        missing = [c for c in strata if c not in frame.columns]
+        if missing:
+            print(f"[WARN] adaptive: dataset has no {', '.join(missing)} column(s); not stratifying on them")
+        self.target_width = target_width
+        self.confidence = confidence
+        self.z = z_for(confidence)
+        self.min_per_stratum = min_per_stratum
+        self.tracked = tracked
+        self.total = len(frame)
+        rng = random.Random(seed)
+        groups = {}
+        for i, row in enumerate(frame[self.strata_cols].to_dict("records") if self.strata_cols else [{}] * len(frame)):
+            groups.setdefault(_key_of(row, self.strata_cols), []).append(i)
+        self.strata = []
+        for key in sorted(groups):
+            idx = groups[key]
+            rng.shuffle(idx)
+            self.strata.append(_Stratum(key, idx))
+        self._of = {i: s for s in self.strata for i in s.order}
+        self._rr = 0
+
+    def _open(self):
+        return [s for s in self.strata if s.closed is None and s.issued < s.N]
+
+    def next_batch(self, size=8, skip=()):
+        """Up to `size` prompt indices, round-robin over the open strata.
+        Indices in `skip` (already answered, e.g. on resume) are passed over."""
+        batch = []
+        while len(batch) < size:
+            open_ = self._open()
+            if not open_:
+                break
+            s = open_[self._rr % len(open_)]
+            self._rr += 1
+            while s.issued < s.N:
+                i = s.order[s.issued]
+                s.issued += 1
+                if i not in skip:
+                    batch.append(i)
+                    break
+        return batch
+
+    def record(self, index, label):
+        s = self._of[index]
+        s.counts[label] = s.counts.get(label, 0) + 1
+        s.n += 1
+        if s.closed is None:
+            if s.n >= s.N:
+                s.closed = "exhausted"
+            elif s.n >= self.min_per_stratum and all(hi - lo <= self.target_width for c, (lo, hi)
+                                                     in s.intervals(self.z).items() if c in self.tracked):
+                s.closed = "precision"
+
+    def done(self):
+        return not self._open()
+
+    def _combine(self, strata):
+        """Size-weighted rate estimates over `strata` -> {class: {rate, lo, hi}}."""
+        N = sum(s.N for s in strata)
+        out = {}
+        for c in CLASSES:
+            rate = var = 0.0
+            for s in strata:
+                w = s.N / N
+                p = s.counts.get(c, 0) / s.n if s.n else 0.5
+                lo, hi = wilson(s.counts.get(c, 0), s.n, self.z)
+                fpc = (s.N - s.n) / (s.N - 1) if s.N > 1 else 0.0
+                rate += w * p
+                var += w * w * fpc * ((hi - lo) / (2 * self.z)) ** 2
+            half = self.z * math.sqrt(var)
+            out[c] = {"rate": round(rate, 5), "lo": round(max(0.0, rate - half), 5),
+                      "hi": round(min(1.0, rate + half), 5)}
+        return out
+
+    def summary(self):
+        evaluated = sum(s.n for s in self.strata)
+        overall = self._combine(self.strata)
+        by_category = {}
+        if "category" in self.strata_cols:
+            pos = self.strata_cols.index("category")
+            cats = {}
+            for s in self.strata:
+                cats.setdefault(s.key[pos], []).append(s)
+            by_category = {k: {"N": sum(s.N for s in v), "n": sum(s.n for s in v), **self._combine(v)}
+                           for k, v in sorted(cats.items())}
+        strata = []
+        for s in self.strata:
+            iv = s.intervals(self.z)
+            strata.append({"key": dict(zip(self.strata_cols, s.key)), "N": s.N, "n": s.n,
+                           "closed": s.closed or "open",
+                           "counts": dict(s.counts),
+                           "rates": {c: {"rate": round(s.counts.get(c, 0) / s.n, 5) if s.n else None,
+                                         "lo": round(iv[c][0], 5), "hi": round(iv[c][1], 5)} for c in CLASSES}})
+        return {"strata_by": self.strata_cols, "target_width": self.target_width, "confidence": self.confidence,
+                "min_per_stratum": self.min_per_stratum,
+                "prompts_total": self.total, "prompts_evaluated": evaluated,
+                "prompts_skipped": self.total - evaluated,
+                "estimates": overall,
+                # population-scale counts, for consumers that expect counts (metrics/engine)
+                "estimated_counts": {c: int(round(overall[c]["rate"] * self.total)) for c in CLASSES},
+                "by_category": by_category, "strata": strata}
+
+def format_summary(s):
+    lines = [f"Adaptive sampling: {s['prompts_evaluated']}/{s['prompts_total']} prompts evaluated, "
+             f"{s['prompts_skipped']} skipped (target width {s['target_width']}, {100 * s['confidence']:.0f}% CI)"]
+    for c in CLASSES:
+        e = s["estimates"][c]
+        lines.append(f"  {c:<8} {e['rate']:.3f}  [{e['lo']:.3f}, {e['hi']:.3f}]")
+    for cat, e in s["by_category"].items():
+        u, r = e["unsafe"], e["refusal"]
+        lines.append(f"  {cat:<20} n={e['n']}/{e['N']}  unsafe {u['rate']:.3f} [{u['lo']:.3f}, {u['hi']:.3f}]  "
+                     f"refusal {r['rate']:.3f} [{r['lo']:.3f}, {r['hi']:.3f}]")
+    return "\n".join(lines)
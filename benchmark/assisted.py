@@ -0,0 +1,158 @@
+# benchmark/assisted.py
+# Assisted (speculative) generation with a small draft model.
+#
+# The draft model proposes tokens and the target checks them all in one
+# forward pass.
+#
+#   draft = AssistedDecoder(model, tokenizer, draft_model, lookahead=4)
+#   text = draft.generate(prompt, max_new_tokens=80, seed=0)
+#
+# Each step the draft model generates up to `lookahead` tokens one by one
+# (cheap), then the target scores prompt + drafts once (one forward pass
+# instead of `lookahead`). Drafts are accepted left to right:
+#
+#   greedy    accept while the draft equals the target's argmax; the first
+#             mismatch is replaced by the target's argmax. The output is
+#             the target's own greedy output.
+#   sampling  standard speculative sampling: accept draft x with probability
+#             min(1, p(x) / q(x)) (p = target, q = draft, both the top-k
+#             distribution SeededSampler uses); on rejection draw from
+#             max(0, p - q) renormalised. Every emitted token is distributed
+#             exactly as if the target had sampled it alone.
+#
+# After all drafts are accepted the target's extra position gives one more
+# token for free. Only one sequence at a time (batch size 1): rows in a
+# batch would accept different numbers of tokens. With a seed, all draws use
+# one generator seeded by utils.row_seed, so runs are reproducible, but they
+# are not token-identical to plain seeded generation (the draws are used
+# differently); the distribution is the same.
+
+import time
+
+try:
+    from benchmark.utils import sampling_probs, row_seed
+    from benchmark import tracing
+except ModuleNotFoundError:
+    from utils import sampling_probs, row_seed
+    import tracing
+
+def _crop(past, n):
+    """Keep the first n positions of a KV cache (legacy tuples or a Cache object)."""
+    if hasattr(past, "crop"):
+        past.crop(n)
+        return past
+    return tuple((k[:, :, :n], v[:, :, :n]) for k, v in past)
+
+class AssistedDecoder:
+    def __init__(self, model, tokenizer, draft_model, lookahead=4, top_k=50, temperature=1.0):
+        if draft_model.config.vocab_size != model.config.vocab_size:
+            raise ValueError("draft and target models must share a tokenizer "
+                             f"(vocab {draft_model.config.vocab_size} vs {model.config.vocab_size})")
+        self.model = model
+        self.tokenizer = tokenizer
+        self.draft = draft_model
+        self.lookahead = max(1, lookahead)
+        self.top_k = top_k
+        self.temperature = temperature
+        self.proposed = self.accepted = self.target_calls = self.tokens = 0
+        self.seconds = 0.0
+
+    def _pick(self, probs_or_logits, greedy, generator):
+        import torch
+        if greedy:
+            return int(torch.argmax(probs_or_logits))
+        return int(torch.multinomial(probs_or_logits, 1, generator=generator))
+
+    def generate_ids(self, input_ids, max_new_tokens=80, greedy=False, generator=None):
+        """input_ids: list of prompt token ids -> list of new token ids."""
+        import torch
+        eos = self.tokenizer.eos_token_id
+        seq = list(input_ids)
+        start = len(seq)
+        t_past = d_past = None
+        t_len = d_len = 0          # positions covered by each KV cache
+        with torch.no_grad():
+            while len(seq) - start < max_new_tokens:
+                # draft k tokens; +1 bonus token below never overshoots max_new_tokens
+                k = min(self.lookahead, max_new_tokens - (len(seq) - start) - 1)
+                drafts, qs = [], []
+                with tracing.span("assist_draft", k=k):
+                    for _ in range(k):
+                        out = self.draft(torch.tensor([(seq + drafts)[d_len:]]), past_key_values=d_past, use_cache=True)
+                        d_past, d_len = out.past_key_values, len(seq) + len(drafts)
+                        logits = out.logits[0, -1]
+                        q = None if greedy else sampling_probs(logits, self.top_k, self.temperature)
+                        x = self._pick(logits if greedy else q, greedy, generator)
+                        drafts.append(x)
+                        qs.append(q)
+                        if x == eos:
+                            break
+                with tracing.span("assist_verify", k=len(drafts)):
+                    out = self.model(torch.tensor([(seq + drafts)[t_len:]]), past_key_values=t_past, use_cache=True)
+                self.target_calls += 1
+                t_past = out.past_key_values
+                # logits predicting drafts[0..k-1] and the token after them
+                logits = out.logits[0, -(len(drafts) + 1):]
+
+                new = []
+                for j, x in enumerate(drafts):
+                    if greedy:
+                        best = int(torch.argmax(logits[j]))
+                        if best != x:
+                            new.append(best)
+                            break
+                    else:
+                        p = sampling_probs(logits[j], self.top_k, self.temperature)
+                        r = float(torch.rand(1, generator=generator))
+                        if r >= min(1.0, float(p[x] / qs[j][x])):
+                            resid = torch.clamp(p - qs[j], min=0)
+                            # p == q up to rounding: fall back to p itself
+                            new.append(self._pick(resid / resid.sum() if resid.sum() > 0 else p, False, generator))
+                            break
+                    new.append(x)
+                else:
+                    last = logits[len(drafts)]
+                    new.append(self._pick(last if greedy else sampling_probs(last, self.top_k, self.temperature),
+                                          greedy, generator))
+                n_acc = len(new) - 1 if len(new) <= len(drafts) else len(drafts)
+                self.proposed += len(drafts)
+                self.accepted += n_acc
+
+                keep = len(seq) + n_acc    # cache entries valid for the accepted prefix
+                t_past, t_len = _crop(t_past, keep), keep
+                if d_past is not None and d_len > keep:
+                    d_past, d_len = _crop(d_past, keep), keep
+                seq.extend(new)
+                if eos is not None and eos in new:
+                    del seq[seq.index(eos, start) + 1:]
+                    break
+        gen = seq[start:]
+        self.tokens += len(gen)
+        tracing.counter("new_tokens", len(gen))
+        return gen
+
+    def generate(self, prompt, max_new_tokens=80, seed=None, greedy=False):
+        """Text of prompt + continuation, decoded like utils.generate_response."""
+        import torch
+        generator = None
+        if seed is not None and not greedy:
+            generator = torch.Generator().manual_seed(row_seed(seed, prompt))
+        t = time.perf_counter()
+        with tracing.span("tokenize"):
+            ids = self.tokenizer(prompt)["input_ids"]
+        gen = self.generate_ids(ids, max_new_tokens, greedy=greedy, generator=generator)
+        tracing.counter("prompts")
+        with tracing.span("decode"):
+            text = self.tokenizer.decode(ids + gen, skip_special_tokens=True)
+        self.seconds += time.perf_counter() - t
+        return text
+
+    def acceptance_rate(self):
+        return self.accepted / self.proposed if self.proposed else None
+
+    def summary(self):
+        rate = self.acceptance_rate()
+        return (f"Assisted decoding: acceptance {'n/a' if rate is None else f'{100 * rate:.1f}%'} "
+                f"({self.accepted}/{self.proposed} draft tokens), "
+                f"{self.tokens / max(self.target_calls, 1):.2f} tokens per target forward, "
+                f"{self.tokens / self.seconds if self.seconds else 0:.1f} tokens/s")
@@ -0,0 +1,428 @@
+# benchmark/daemon.py
+# Long-lived local daemon that keeps models and the toxicity scorer warm.
+#
+#   python -m benchmark.daemon --preload distilgpt2 --preload_detoxify &
+#   python -m benchmark.run_benchmark --model_name distilgpt2 ...   # uses it automatically
+#
+# Localhost HTTP only (default 127.0.0.1:8765, override with BENCH_DAEMON_URL):
+#   GET  /health     loaded models (with resolved commits), generation settings,
+#                    results directory, queue sizes, batch statistics
+#   POST /generate   {"model", "revision", "prompts", "max_new_tokens", "seed"}
+#                    -> NDJSON stream of {"index", "response"} as batches finish
+#   POST /evaluate   {"path", "tox_threshold", "force"} evaluates a results file in place;
+#                    only .csv/.parquet files under --results_dir are accepted
+#                    (optional "tox_cascade", "tox_band": see evaluate_results)
+#                    {"texts"} -> [{"classification", "matched_keyword", "toxicity"}]
+#   POST /shutdown
+#
+# Each loaded model has one worker thread and a queue of prompts. The worker
+# takes what is queued (waiting up to --coalesce_ms for more), so prompts
+# from concurrent requests with the same generation settings share batches.
+# With a seed, SeededSampler makes every row independent of its batch, so a
+# coalesced result is identical to a standalone run. Evaluation runs on one
+# thread that owns the Detoxify scorer (and its SQLite cache connection).
+
+import os, sys, json, time, queue, argparse, threading, urllib.request, urllib.error
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(CURRENT_DIR)
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+from benchmark.utils import load_model, iter_generate, format_load_stats
+from benchmark.evaluate import evaluate_results, classify_series, TOX_VARIANT
+from benchmark.toxicity import get_scorer
+from benchmark.gen_cache import SAMPLING, model_revision
+
+DEFAULT_URL = "http://127.0.0.1:8765"
+RESULTS_DIR = os.path.join(REPO_ROOT, "results")
+# what every worker generates with (fp32 weights, SeededSampler / default sampling)
+GENERATION = {"quantize": None, "sampling": SAMPLING}
+
+def path_allowed(path, results_dir):
+    """True for a .csv/.parquet file inside `results_dir` (after resolving symlinks and '..')."""
+    real = os.path.realpath(path)
+    root = os.path.realpath(results_dir)
+    return real.endswith((".csv", ".parquet")) and os.path.commonpath([real, root]) == root
+
+def daemon_url():
+    return os.getenv("BENCH_DAEMON_URL", DEFAULT_URL).rstrip("/")
+
+class _Job:
+    """One /generate request: its prompts fan out to the model queue and the
+    results come back here, in completion order."""
+
+    def __init__(self, n):
+        self.remaining = n
+        self.results = queue.Queue()
+
+    def put(self, index, response):
+        self.results.put(("ok", index, response))
+
+    def fail(self, index, error):
+        self.results.put(("error", index, error))
+
+class ModelWorker(threading.Thread):
+    def __init__(self, model_name, revision, max_batch, coalesce_s):
+        super().__init__(name=f"model:{model_name}", daemon=True)
+        self.model_name = model_name
+        self.revision = revision
+        self.max_batch = max_batch
+        self.coalesce_s = coalesce_s
+        self.queue = queue.Queue()
+        self.model = self.tokenizer = None
+        self.commit = None
+        self.ready = threading.Event()
+        self.batches = self.prompts = 0
+        self.last_used = time.time()
+        self._stopping = False
+        self._pending = 0          # submitted prompts not answered yet (queued or in a batch)
+        self._pending_lock = threading.Lock()
+
+    def submit(self, job, items, max_new_tokens, seed):
+        self.last_used = time.time()
+        with self._pending_lock:
+            self._pending += len(items)
+        for index, prompt in items:
+            self.queue.put((job, index, prompt, max_new_tokens, seed))
+
+    def _answered(self, n=1):
+        with self._pending_lock:
+            self._pending -= n
+
+    def busy(self):
+        """True while any submitted prompt is queued or being generated; an
+        empty queue alone doesn't say the worker is idle mid-batch."""
+        return self._pending > 0
+
+    def stop(self):
+        self._stopping = True
+        self.queue.put(None)
+
+    def _take(self):
+        first = self.queue.get()
+        if first is None:
+            return []
+        items = [first]
+        deadline = time.monotonic() + self.coalesce_s
+        while len(items) < self.max_batch:
+            try:
+                item = self.queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+            if item is None:
+                self._stopping = True
+                break
+            items.append(item)
+        return items
+
+    def run(self):
+        try:
+            self.model, self.tokenizer = load_model(self.model_name, revision=self.revision)
+            self.commit = getattr(self.model.config, "_commit_hash", None)
+            print(format_load_stats(), flush=True)
+        except Exception as e:
+            self.load_error = e
+            self.ready.set()
+            while True:  # fail everything sent to a model that can't load
+                item = self.queue.get()
+                if item is None:
+                    return
+                item[0].fail(item[1], f"could not load {self.model_name}: {e}")
+                self._answered()
+        self.ready.set()
+        while not self._stopping:
+            items = self._take()
+            groups = {}
+            for item in items:
+                groups.setdefault((item[3], item[4]), []).append(item)
+            for (max_new_tokens, seed), group in groups.items():
+                self._run_group(group, max_new_tokens, seed)
+
+    def _run_group(self, group, max_new_tokens, seed):
+        prompts = [g[2] for g in group]
+        done = set()
+        try:
+            for k, text in iter_generate(prompts, self.model, self.tokenizer, max_new_tokens=max_new_tokens,
+                                         batch_size=self.max_batch, seed=seed):
+                group[k][0].put(group[k][1], text)
+                done.add(k)
+                self._answered()
+        except Exception as e:
+            for k, (job, index, *_) in enumerate(group):
+                if k not in done:
+                    job.fail(index, f"{type(e).__name__}: {e}")
+                    self._answered()
+        self.batches += 1
+        self.prompts += len(group)
+
+class EvalWorker(threading.Thread):
+    """Owns the toxicity scorer; text requests queued together are scored together."""
+
+    def __init__(self, preload_detoxify=False):
+        super().__init__(name="evaluate", daemon=True)
+        self.queue = queue.Queue()
+        self.preload_detoxify = preload_detoxify
+        self.requests = 0
+
+    def call(self, kind, payload):
+        done = queue.Queue(maxsize=1)
+        self.queue.put((kind, payload, done))
+        status, value = done.get()
+        if status == "error":
+            raise RuntimeError(value)
+        return value
+
+    def run(self):
+        if self.preload_detoxify:
+            try:
+                get_scorer(TOX_VARIANT).model
+                print("Detoxify loaded", flush=True)
+            except Exception as e:
+                print(f"[WARN] Detoxify unavailable: {e}", flush=True)
+        while True:
+            batch = [self.queue.get()]
+            while True:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            texts = [item for item in batch if item[0] == "texts"]
+            for item in batch:
+                if item[0] == "path":
+                    req = item[1]
+                    self._respond(item[2], lambda: self._evaluate_file(
+                        req["path"], float(req.get("tox_threshold", 0.5)), bool(req.get("force", False)),
+                        req.get("tox_cascade"), req.get("tox_band")))
+            if texts:
+                self._score_texts(texts)
+            self.requests += len(batch)
+
+    @staticmethod
+    def _respond(done, fn):
+        try:
+            done.put(("ok", fn()))
+        except Exception as e:
+            done.put(("error", f"{type(e).__name__}: {e}"))
+
+    @staticmethod
+    def _evaluate_file(path, tox_threshold=0.5, force=False, tox_cascade=None, tox_band=None):
+        df = evaluate_results(path, tox_threshold=tox_threshold, force=force, tox_cascade=tox_cascade,
+                              tox_band=tox_band)
+        return {"rows": len(df),
+                "counts": {str(k): int(v) for k, v in df["classification"].value_counts().items()},
+                "tox_counts": {str(k): int(v) for k, v in df["tox_label"].value_counts().items()}}
+
+    def _score_texts(self, items):
+        import pandas as pd
+        all_texts = [t for _, payload, _ in items for t in payload["texts"]]
+        try:
+            cls, kw = classify_series(pd.Series(all_texts, dtype=object).fillna("").astype(str))
+            try:
+                tox = get_scorer(TOX_VARIANT).score(all_texts)
+            except Exception as e:
+                print(f"[WARN] Detoxify unavailable or failed: {e}", flush=True)
+                tox = [None] * len(all_texts)
+        except Exception as e:
+            for _, _, done in items:
+                done.put(("error", f"{type(e).__name__}: {e}"))
+            return
+        k = 0
+        for _, payload, done in items:
+            n = len(payload["texts"])
+            done.put(("ok", [{"classification": cls.iloc[j], "matched_keyword": kw.iloc[j], "toxicity": tox[j]}
+                             for j in range(k, k + n)]))
+            k += n
+
+class Daemon:
+    def __init__(self, max_models=2, max_batch=16, coalesce_ms=20, preload_detoxify=False, results_dir=RESULTS_DIR):
+        self.results_dir = os.path.realpath(results_dir)
+        self.max_models = max_models
+        self.max_batch = max_batch
+        self.coalesce_s = coalesce_ms / 1000.0
+        self.workers = OrderedDict()
+        self._lock = threading.Lock()
+        self.evaluator = EvalWorker(preload_detoxify)
+        self.evaluator.start()
+        self.started = time.time()
+
+    def _worker(self, model_name, revision):
+        key = (model_name, revision)
+        w = self.workers.get(key)
+        if w is None:
+            idle = [k for k, v in self.workers.items() if not v.busy()]
+            while len(self.workers) >= self.max_models and idle:
+                self.workers.pop(idle.pop(0)).stop()  # least recently used idle model
+            w = self.workers[key] = ModelWorker(model_name, revision, self.max_batch, self.coalesce_s)
+            w.start()
+        self.workers.move_to_end(key)
+        return w
+
+    def preload(self, model_name, revision=None):
+        with self._lock:
+            self._worker(model_name, revision)
+
+    def submit(self, model_name, revision, job, items, max_new_tokens, seed):
+        # under the lock, so a worker can't be evicted between lookup and enqueue
+        with self._lock:
+            self._worker(model_name, revision).submit(job, items, max_new_tokens, seed)
+
+    def health(self):
+        return {"uptime_s": round(time.time() - self.started, 1),
+                "generation": GENERATION, "results_dir": self.results_dir,
+                "models": [{"model": k[0], "revision": k[1], "commit": w.commit, "ready": w.ready.is_set(),
+                            "queued": w.queue.qsize(), "busy": w.busy(), "batches": w.batches, "prompts": w.prompts,
+                            "mean_batch": round(w.prompts / w.batches, 2) if w.batches else None}
+                           for k, w in self.workers.items()],
+                "eval_requests": self.evaluator.requests}
+
+def _make_handler(daemon, server_ref):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, fmt, *args):
+            pass
+
+        def _json(self, code, obj):
+            body = json.dumps(obj).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _body(self):
+            n = int(self.headers.get("Content-Length") or 0)
+            return json.loads(self.rfile.read(n) or b"{}")
+
+        def do_GET(self):
+            if self.path == "/health":
+                return self._json(200, daemon.health())
+            self._json(404, {"error": "not found"})
+
+        def do_POST(self):
+            try:
+                req = self._body()
+            except ValueError as e:
+                return self._json(400, {"error": f"bad JSON: {e}"})
+            if self.path == "/generate":
+                return self._generate(req)
+            if self.path == "/evaluate":
+                kind = "texts" if "texts" in req else "path"
+                if kind == "path" and not req.get("path"):
+                    return self._json(400, {"error": "need 'path' or 'texts'"})
+                if kind == "path" and not path_allowed(req["path"], daemon.results_dir):
+                    return self._json(403, {"error": f"only .csv/.parquet files under {daemon.results_dir} "
+                                                     f"can be evaluated in place"})
+                try:
+                    return self._json(200, daemon.evaluator.call(kind, req))
+                except RuntimeError as e:
+                    return self._json(500, {"error": str(e)})
+            if self.path == "/shutdown":
+                self._json(200, {"ok": True})
+                threading.Thread(target=server_ref[0].shutdown, daemon=True).start()
+                return
+            self._json(404, {"error": "not found"})
+
+        def _generate(self, req):
+            prompts = req.get("prompts") or []
+            if not req.get("model"):
+                return self._json(400, {"error": "need 'model'"})
+            job = _Job(len(prompts))
+            daemon.submit(req["model"], req.get("revision"), job, list(enumerate(prompts)),
+                          int(req.get("max_new_tokens", 80)), req.get("seed"))
+            # HTTP/1.0 + no Content-Length: the stream ends when we close.
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.end_headers()
+            for _ in range(job.remaining):
+                status, index, value = job.results.get()
+                line = {"index": index, "response": value} if status == "ok" else {"index": index, "error": value}
+                self.wfile.write((json.dumps(line) + "\n").encode("utf-8"))
+                self.wfile.flush()
+    return Handler
+
+def serve(host="127.0.0.1", port=8765, preload=(), **kwargs):
+    daemon = Daemon(**kwargs)
+    for name in preload:
+        daemon.preload(name)
+    server_ref = []
+    server = ThreadingHTTPServer((host, port), _make_handler(daemon, server_ref))
+    server.daemon_threads = True
+    server_ref.append(server)
+    print(f"Benchmark daemon listening on http://{host}:{server.server_address[1]}", flush=True)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+# ---- client side -------------------------------------------------------------
+
+def health(url=None, timeout=5):
+    with urllib.request.urlopen((url or daemon_url()) + "/health", timeout=timeout) as r:
+        return json.loads(r.read())
+
+def mismatches(status, model_name, revision=None, quantize=None, greedy=False):
+    """Ways the daemon described by `status` (a /health reply) would generate
+    differently from a local run with these settings; empty if it matches."""
+    gen = status.get("generation") or {}
+    out = []
+    if gen.get("quantize") != quantize:
+        out.append(f"quantize {gen.get('quantize')} (wanted {quantize})")
+    wanted = "greedy" if greedy else SAMPLING
+    if gen.get("sampling") != wanted:
+        out.append(f"sampling {gen.get('sampling')} (wanted {wanted})")
+    loaded = [m for m in status.get("models", [])
+              if m["model"] == model_name and m.get("revision") == revision and m.get("commit")]
+    if loaded:
+        local = model_revision(model_name, revision)
+        if local and loaded[0]["commit"] != local:
+            out.append(f"{model_name} loaded at commit {loaded[0]['commit']} (wanted {local})")
+    return out
+
+def is_running(url=None, timeout=0.5):
+    try:
+        with urllib.request.urlopen((url or daemon_url()) + "/health", timeout=timeout) as r:
+            return r.status == 200
+    except (urllib.error.URLError, OSError, ValueError):
+        return False
+
+def _post(url, payload, timeout):
+    req = urllib.request.Request(url, data=json.dumps(payload).encode("utf-8"),
+                                 headers={"Content-Type": "application/json"})
+    return urllib.request.urlopen(req, timeout=timeout)
+
+def generate_remote(prompts, model_name, revision=None, max_new_tokens=80, seed=None, url=None, timeout=3600):
+    """Yield (index, response) from the daemon as results stream in."""
+    with _post((url or daemon_url()) + "/generate",
+               {"model": model_name, "revision": revision, "prompts": list(prompts),
+                "max_new_tokens": max_new_tokens, "seed": seed}, timeout) as r:
+        for line in r:
+            rec = json.loads(line)
+            if "error" in rec:
+                raise RuntimeError(f"daemon failed on prompt {rec['index']}: {rec['error']}")
+            yield rec["index"], rec["response"]
+
+def evaluate_remote(path, tox_threshold=0.5, force=False, url=None, timeout=3600, tox_cascade=None, tox_band=None):
+    req = {"path": os.path.abspath(path), "tox_threshold": tox_threshold, "force": force}
+    if tox_cascade:
+        req.update(tox_cascade=os.path.abspath(tox_cascade), tox_band=tox_band)
+    with _post((url or daemon_url()) + "/evaluate", req, timeout) as r:
+        return json.loads(r.read())
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Warm model / scorer daemon for run_benchmark")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=int(daemon_url().rsplit(":", 1)[-1]))
+    p.add_argument("--preload", action="append", default=[], help="model to load at startup (repeatable)")
+    p.add_argument("--preload_detoxify", action="store_true")
+    p.add_argument("--max_models", type=int, default=2, help="models kept loaded at once (idle ones are evicted)")
+    p.add_argument("--max_batch", type=int, default=16, help="max prompts per coalesced generate() call")
+    p.add_argument("--coalesce_ms", type=int, default=20, help="how long a worker waits to fill a batch")
+    p.add_argument("--results_dir", default=RESULTS_DIR, help="/evaluate only rewrites results files under here")
+    args = p.parse_args(argv)
+    serve(args.host, args.port, args.preload, max_models=args.max_models, max_batch=args.max_batch,
+          coalesce_ms=args.coalesce_ms, preload_detoxify=args.preload_detoxify, results_dir=args.results_dir)
+
+if __name__ == "__main__":
+    main()
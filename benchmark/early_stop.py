@@ -0,0 +1,106 @@
+# benchmark/early_stop.py
+# Stop generating a row once its safety verdict can no longer change.
+#
+# The verdict is evaluate.classify_response on the decoded continuation only.
+# The results file stores prompt + continuation, whose label can only rank
+# at or above the continuation's: keyword hits only accumulate as text is
+# appended, and "unsafe" outranks everything, so once a toxic keyword shows
+# up in the generated text the row will be classified unsafe however long
+# it runs; only that label is final by default. Keywords already in the
+# prompt never stop a row (that would leave an almost empty response and
+# change its toxicity score). "refusal" is not: a later toxic
+# keyword would still turn the row unsafe, so stopping on it changes the
+# verdict for those rows (opt in with final=("unsafe", "refusal")).
+#
+# VerdictStop is a per-row stopping criterion for generate(): a flagged row
+# is retired (it only receives padding from then on) and the batch ends as
+# soon as every row is retired or hit EOS. Like SeededSampler it is a plain
+# callable, so this module does not import transformers.
+
+from collections import Counter
+
+try:
+    from benchmark.evaluate import SAFETY_MATCHER
+    from benchmark import tracing
+except ModuleNotFoundError:
+    from evaluate import SAFETY_MATCHER
+    import tracing
+
+DEFAULT_FINAL = ("unsafe",)
+
+class VerdictStop:
+    """Stopping criterion that retires rows whose verdict is in `final`.
+
+    iter_generate() calls start() before and finish() after each batch;
+    per-prompt results land in `records[index]` as
+    {"stop_reason", "new_tokens", "tokens_saved"} where stop_reason is the
+    verdict label, "eos" or "max_new_tokens".
+    """
+
+    def __init__(self, tokenizer, final=DEFAULT_FINAL, matcher=SAFETY_MATCHER, check_every=1):
+        self.tokenizer = tokenizer
+        self.final = set(final)
+        self.matcher = matcher
+        self.check_every = max(1, check_every)
+        self.records = {}
+        self.reasons = Counter()
+        self.rows = self.tokens = self.tokens_saved = 0
+        self.steps = self.steps_saved = 0
+
+    def start(self, indices, prompt_width):
+        self._indices = list(indices)
+        self._width = prompt_width
+        self._stopped = {}   # batch row -> (label, new tokens at the stop)
+
+    def __call__(self, input_ids, scores, **kwargs):
+        import torch
+        step = input_ids.shape[1] - self._width
+        done = torch.zeros(input_ids.shape[0], dtype=torch.bool)
+        for r in self._stopped:
+            done[r] = True
+        if step % self.check_every:
+            return done
+        eos = self.tokenizer.eos_token_id
+        rows = [r for r in range(input_ids.shape[0])
+                if r not in self._stopped and not (eos is not None and int(input_ids[r, -1]) == eos)]
+        if not rows:
+            return done
+        with tracing.span("verdict_check", rows=len(rows)):
+            texts = self.tokenizer.batch_decode(input_ids[rows, self._width:], skip_special_tokens=True)
+            labels = self.matcher.classify_many(texts)
+        for r, label in zip(rows, labels):
+            if label in self.final:
+                self._stopped[r] = (label, step)
+                done[r] = True
+        return done
+
+    def finish(self, output_ids, max_new_tokens):
+        eos = self.tokenizer.eos_token_id
+        steps = output_ids.shape[1] - self._width
+        for r, i in enumerate(self._indices):
+            if r in self._stopped:
+                reason, n = self._stopped[r]
+            else:
+                gen = output_ids[r, self._width:].tolist()
+                if eos is not None and eos in gen:
+                    reason, n = "eos", gen.index(eos) + 1
+                else:
+                    reason, n = "max_new_tokens", len(gen)
+            saved = max_new_tokens - n if r in self._stopped else 0
+            self.records[i] = {"stop_reason": reason, "new_tokens": n, "tokens_saved": saved}
+            self.reasons[reason] += 1
+            self.rows += 1
+            self.tokens += n
+            self.tokens_saved += saved
+        # forward passes actually skipped: only when the whole batch retired early
+        self.steps += steps
+        if len(self._stopped) and steps < max_new_tokens:
+            self.steps_saved += max_new_tokens - steps
+        tracing.counter("tokens_saved", sum(self.records[i]["tokens_saved"] for i in self._indices))
+
+    def summary(self):
+        budget = self.tokens + self.tokens_saved
+        reasons = ", ".join(f"{k}: {v}" for k, v in self.reasons.most_common())
+        return (f"Early stop: {self.rows} rows ({reasons}); {self.tokens_saved} tokens saved "
+                f"({100.0 * self.tokens_saved / max(budget, 1):.1f}% of generated + saved), "
+                f"{self.steps_saved} batch decode steps skipped")
@@ -0,0 +1,106 @@
+# benchmark/gen_cache.py
+# Content-addressed on-disk cache of generated responses.
+#
+# The daily live sets repeat a lot of prompts (recurring trends, fallback
+# prompts like "Global AI news"), so responses are cached under a hash of
+# everything that determines them: model name + revision, prompt,
+# max_new_tokens, sampling parameters and seed. Only seeded generation is
+# reproducible, so the cache refuses to work without a seed.
+#
+# Storage is a single SQLite file; entries carry a last-used timestamp and
+# the oldest are evicted once the total response size exceeds max_bytes.
+# It is a local cache (run_benchmark --gen_cache, e.g. under the git-ignored
+# .cache/): the CI evaluation runs a multi-model sweep, which doesn't take
+# --gen_cache, so only repeated local runs save generation time.
+
+import os, json, time, hashlib, sqlite3
+
+# Must match utils.SeededSampler defaults.
+SAMPLING = {"top_k": 50, "temperature": 1.0}
+
+def model_revision(model_name, revision=None):
+    """Resolve the commit hash for a hub model (or None for local paths)."""
+    try:
+        from transformers import AutoConfig
+        cfg = AutoConfig.from_pretrained(model_name, revision=revision)
+        return getattr(cfg, "_commit_hash", None) or revision
+    except Exception as e:
+        print(f"[WARN] could not resolve revision for {model_name}: {e}")
+        return revision
+
+class GenerationCache:
+    def __init__(self, path, max_bytes=256 * 1024 * 1024):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = self.misses = self.evictions = 0
+        self._db = sqlite3.connect(path)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " key TEXT PRIMARY KEY, response TEXT NOT NULL,"
+            " size INTEGER NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS entries_lru ON entries(last_used)")
+        self._db.commit()
+
+    @staticmethod
+    def make_key(model_name, revision, prompt, max_new_tokens, seed, sampling=SAMPLING):
+        if seed is None:
+            raise ValueError("generation cache needs a seed: unseeded samples are not reproducible")
+        payload = json.dumps({
+            "model": model_name, "revision": revision, "prompt": prompt,
+            "max_new_tokens": max_new_tokens, "sampling": sampling, "seed": seed,
+        }, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get_many(self, keys):
+        """Return {key: response} for the keys present, refreshing their LRU stamp."""
+        found = {}
+        uniq = list(dict.fromkeys(keys))
+        for k in range(0, len(uniq), 500):
+            chunk = uniq[k:k + 500]
+            marks = ",".join("?" * len(chunk))
+            rows = self._db.execute(f"SELECT key, response FROM entries WHERE key IN ({marks})", chunk)
+            found.update(rows.fetchall())
+        if found:
+            now = time.time()
+            self._db.executemany("UPDATE entries SET last_used=? WHERE key=?", [(now, k) for k in found])
+            self._db.commit()
+        self.hits += sum(1 for k in keys if k in found)
+        self.misses += sum(1 for k in keys if k not in found)
+        return found
+
+    def put(self, key, response):
+        size = len(response.encode("utf-8"))
+        self._db.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)", (key, response, size, time.time()))
+        self._db.commit()
+
+    def total_bytes(self):
+        return self._db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def evict(self):
+        """Drop least-recently-used entries until the cache fits in max_bytes."""
+        excess = self.total_bytes() - self.max_bytes
+        if excess <= 0:
+            return 0
+        doomed, freed = [], 0
+        for key, size in self._db.execute("SELECT key, size FROM entries ORDER BY last_used"):
+            if freed >= excess:
+                break
+            doomed.append((key,))
+            freed += size
+        self._db.executemany("DELETE FROM entries WHERE key=?", doomed)
+        self._db.commit()
+        self.evictions += len(doomed)
+        return len(doomed)
+
+    def stats(self):
+        n = self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "entries": n, "bytes": self.total_bytes(), "hits": self.hits, "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None, "evictions": self.evictions,
+        }
+
+    def close(self):
+        self._db.close()
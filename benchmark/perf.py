@@ -0,0 +1,324 @@
+# benchmark/perf.py
+# Offline performance suite for the generation and evaluation pipeline.
+#
+# Everything runs locally: a tiny GPT-2 (random weights, byte-level BPE
+# tokenizer trained on the synthetic corpus) is built once under
+# .cache/perf/ and reused, and prompts/responses are generated from a fixed
+# seed, so two runs of the same config measure the same work.
+#
+#   python -m benchmark.perf --n_prompts 64 --prompt_words 40           # run + record
+#   python -m benchmark.perf --compare --threshold 0.1 --fail_on_regression
+#
+# Each run appends one JSON line to results/perf_history.jsonl; --compare
+# checks the run against the latest earlier record with the same config.
+
+import os, sys, io, json, time, random, platform, argparse, tempfile, subprocess, contextlib
+import numpy as np
+import pandas as pd
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(CURRENT_DIR)
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+from benchmark.utils import load_model, generate_response, LOAD_STATS, peak_rss_mb
+from benchmark.evaluate import classify_series, evaluate_results, TOXIC_KEYWORDS, REFUSAL_PHRASES, TOX_VARIANT
+from benchmark import toxicity
+from benchmark.toxicity import ToxicityScorer
+
+HISTORY_PATH = os.path.join(REPO_ROOT, "results", "perf_history.jsonl")
+TINY_DIR = os.path.join(REPO_ROOT, ".cache", "perf")
+
+# direction of "better" for each metric; anything else is informational
+HIGHER_IS_BETTER = ("gen_prompts_per_s", "gen_tokens_per_s", "classify_texts_per_s",
+                    "toxicity_texts_per_s", "categorize_texts_per_s", "evaluate_rows_per_s")
+LOWER_IS_BETTER = ("latency_p50_ms", "latency_p95_ms", "latency_p99_ms", "load_weights_s", "peak_rss_mb",
+                   "import_evaluate_s", "import_run_benchmark_s", "cold_start_s", "cold_load_peak_rss_mb")
+
+_WORDS = ("the model city news policy weather market team game school music river energy health "
+          "travel science phone video price review update people world market data local story "
+          "tomorrow yesterday great terrible help question answer think really maybe").split()
+
+def synthetic_prompts(n, words=40, seed=0):
+    """Deterministic 'User: ... Assistant:' prompts of about `words` words."""
+    rng = random.Random(seed)
+    out = []
+    for _ in range(n):
+        k = max(1, int(rng.gauss(words, words * 0.25)))
+        text = " ".join(rng.choice(_WORDS) for _ in range(k))
+        out.append(f"User: {text}\nAssistant:")
+    return out
+
+def synthetic_responses(n, words=40, seed=0):
+    """Responses mixing plain text with refusal phrases and flagged keywords (~1/3 each)."""
+    rng = random.Random(seed + 1)
+    out = []
+    for i in range(n):
+        text = " ".join(rng.choice(_WORDS) for _ in range(words))
+        if i % 3 == 1:
+            text = rng.choice(REFUSAL_PHRASES) + " " + text
+        elif i % 3 == 2:
+            text = text + " " + rng.choice(TOXIC_KEYWORDS)
+        out.append(text)
+    return out
+
+def build_tiny_model(path=None, vocab_size=2000, n_layer=2, n_embd=64, seed=0):
+    """Create (once) a tiny GPT-2 with a locally trained tokenizer; returns its directory."""
+    path = path or os.path.join(TINY_DIR, f"tiny-gpt2-v{vocab_size}-l{n_layer}-e{n_embd}-s{seed}")
+    if os.path.exists(os.path.join(path, "config.json")):
+        return path
+    import torch
+    from tokenizers import ByteLevelBPETokenizer
+    from transformers import GPT2Config, GPT2LMHeadModel, GPT2TokenizerFast
+
+    os.makedirs(path, exist_ok=True)
+    corpus = synthetic_prompts(2000, seed=seed) + synthetic_responses(2000, seed=seed)
+    bpe = ByteLevelBPETokenizer()
+    bpe.train_from_iterator(corpus, vocab_size=vocab_size, special_tokens=["<|endoftext|>"])
+    bpe.save_model(path)
+    tok = GPT2TokenizerFast(vocab_file=os.path.join(path, "vocab.json"),
+                            merges_file=os.path.join(path, "merges.txt"))
+    tok.save_pretrained(path)
+
+    torch.manual_seed(seed)
+    eos = tok.convert_tokens_to_ids("<|endoftext|>")
+    cfg = GPT2Config(vocab_size=len(tok), n_layer=n_layer, n_embd=n_embd, n_head=4,
+                     bos_token_id=eos, eos_token_id=eos)
+    GPT2LMHeadModel(cfg).save_pretrained(path)
+    return path
+
+def _rate(n, seconds):
+    return round(n / seconds, 3) if seconds > 0 else None
+
+def bench_generate(model_path, prompts, max_new_tokens, seed, warmup=2):
+    model, tok = load_model(model_path)
+    # tokenizer + weights only; imports are in cold_start_s. Named apart from the
+    # older load_s (which included imports) so --compare never pairs the two.
+    load_s = LOAD_STATS["tokenizer_s"] + LOAD_STATS["weights_s"]
+    if model.generation_config.pad_token_id is None:
+        model.generation_config.pad_token_id = tok.eos_token_id  # silences the per-call warning
+
+    for p in prompts[:warmup]:
+        generate_response(p, model, tok, max_new_tokens=max_new_tokens, seed=seed)
+    lat, new_tokens = [], 0
+    for p in prompts:
+        t = time.perf_counter()
+        resp = generate_response(p, model, tok, max_new_tokens=max_new_tokens, seed=seed)
+        lat.append(time.perf_counter() - t)
+        # re-tokenized, so approximate for tokenizers that don't round-trip exactly
+        new_tokens += max(0, len(tok(resp).input_ids) - len(tok(p).input_ids))
+    total = sum(lat)
+    p50, p95, p99 = np.percentile(np.array(lat) * 1000, [50, 95, 99])
+    return {"load_weights_s": round(load_s, 4),
+            "gen_prompts_per_s": _rate(len(prompts), total),
+            "gen_tokens_per_s": _rate(new_tokens, total),
+            "gen_new_tokens": new_tokens,
+            "latency_p50_ms": round(float(p50), 3),
+            "latency_p95_ms": round(float(p95), 3),
+            "latency_p99_ms": round(float(p99), 3)}
+
+_COLD_START = """
+import sys, json, time
+t0 = time.perf_counter()
+sys.path.insert(0, {root!r})
+import benchmark.evaluate
+t1 = time.perf_counter()
+evaluate_torch = "torch" in sys.modules
+import benchmark.run_benchmark
+t2 = time.perf_counter()
+run_torch = "torch" in sys.modules
+from benchmark.utils import load_model, LOAD_STATS
+load_model({model!r})
+print(json.dumps(dict(LOAD_STATS, import_evaluate_s=t1 - t0, import_run_benchmark_s=t2 - t1,
+                      cold_start_s=time.perf_counter() - t0, evaluate_torch=evaluate_torch, run_torch=run_torch)))
+"""
+
+def bench_cold_start(model_path):
+    """Import + load in a fresh interpreter, so nothing is already imported or warm."""
+    code = _COLD_START.format(root=REPO_ROOT, model=model_path)
+    res = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True)
+    if res.returncode != 0:
+        print(f"[WARN] cold-start benchmark failed: {res.stderr.strip().splitlines()[-1:]}")
+        return {}
+    st = json.loads(res.stdout.strip().splitlines()[-1])
+    if st["evaluate_torch"] or st["run_torch"]:
+        print("[WARN] torch was imported at module import time "
+              f"(evaluate: {st['evaluate_torch']}, run_benchmark: {st['run_torch']})")
+    return {"import_evaluate_s": round(st["import_evaluate_s"], 4),
+            "import_run_benchmark_s": round(st["import_run_benchmark_s"], 4),
+            "cold_start_s": round(st["cold_start_s"], 4),
+            "cold_import_torch_s": st["import_s"],
+            "cold_weights_s": st["weights_s"],
+            "cold_load_peak_rss_mb": st["peak_rss_mb"]}
+
+def bench_classify(texts, repeat=3):
+    s = pd.Series(texts)
+    best = min(_timed(lambda: classify_series(s)) for _ in range(repeat))
+    return {"classify_texts_per_s": _rate(len(texts), best)}
+
+def bench_categorize(texts, repeat=3):
+    try:
+        from collectors.collectors.templates import categorize_many
+    except ImportError as e:
+        print(f"[WARN] categorize benchmark skipped: {e}")
+        return {"categorize_texts_per_s": None}
+    best = min(_timed(lambda: categorize_many(texts)) for _ in range(repeat))
+    return {"categorize_texts_per_s": _rate(len(texts), best)}
+
+def bench_toxicity(texts):
+    # no score cache, so this measures the model and not SQLite
+    scorer = ToxicityScorer(cache_path=None)
+    try:
+        scorer.model
+    except Exception as e:
+        print(f"[WARN] toxicity benchmark skipped: {e}")
+        return {"toxicity_texts_per_s": None}
+    return {"toxicity_texts_per_s": _rate(len(texts), _timed(lambda: scorer.score(texts)))}
+
+@contextlib.contextmanager
+def _fresh_scorer(cache_path):
+    """Point evaluate_results' shared scorer at an empty score cache, so the
+    timing doesn't depend on whether .cache/toxicity.sqlite is warm."""
+    saved = toxicity._scorers.get(TOX_VARIANT)
+    scorer = toxicity._scorers[TOX_VARIANT] = ToxicityScorer(TOX_VARIANT, cache_path=cache_path)
+    try:
+        scorer.model  # load Detoxify outside the timed region
+    except Exception:
+        pass          # evaluate_results warns and carries on without toxicity
+    try:
+        yield scorer
+    finally:
+        scorer._db.close()
+        if saved is None:
+            toxicity._scorers.pop(TOX_VARIANT, None)
+        else:
+            toxicity._scorers[TOX_VARIANT] = saved
+
+def bench_evaluate(prompts, responses):
+    """End-to-end evaluate_results on a fresh CSV with an empty score cache
+    (toxicity falls back if Detoxify is missing)."""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "perf_outputs.csv")
+        pd.DataFrame({"prompt": prompts, "response": responses}).to_csv(path, index=False)
+        with _fresh_scorer(os.path.join(tmp, "toxicity.sqlite")), contextlib.redirect_stdout(io.StringIO()):
+            seconds = _timed(lambda: evaluate_results(path, force=True))
+    return {"evaluate_rows_per_s": _rate(len(prompts), seconds)}
+
+def _timed(fn):
+    t = time.perf_counter()
+    fn()
+    return time.perf_counter() - t
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except Exception:
+        return None
+
+def _versions():
+    out = {"python": platform.python_version()}
+    for mod in ("torch", "transformers", "pandas", "numpy"):
+        try:
+            out[mod] = __import__(mod).__version__
+        except ImportError:
+            pass
+    return out
+
+def run_suite(args):
+    model_path = args.model or build_tiny_model(vocab_size=args.vocab_size, seed=args.seed)
+    prompts = synthetic_prompts(args.n_prompts, args.prompt_words, args.seed)
+    texts = synthetic_responses(args.n_texts, args.prompt_words, args.seed)
+
+    metrics = {}
+    if not args.skip_generate:
+        metrics.update(bench_cold_start(model_path))
+        metrics.update(bench_generate(model_path, prompts, args.max_new_tokens, args.seed))
+    metrics.update(bench_classify(texts))
+    metrics.update(bench_categorize(texts))
+    if not args.skip_toxicity:
+        metrics.update(bench_toxicity(texts[:args.n_prompts]))
+    metrics.update(bench_evaluate(texts, texts))
+    metrics["peak_rss_mb"] = round(peak_rss_mb(), 1)
+    return model_path, metrics
+
+def config_of(args):
+    return {"model": args.model or f"tiny-gpt2-v{args.vocab_size}", "n_prompts": args.n_prompts,
+            "n_texts": args.n_texts, "prompt_words": args.prompt_words,
+            "max_new_tokens": args.max_new_tokens, "seed": args.seed,
+            "skip_generate": args.skip_generate, "skip_toxicity": args.skip_toxicity}
+
+def read_history(path=HISTORY_PATH):
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def append_history(record, path=HISTORY_PATH):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record, sort_keys=True) + "\n")
+
+def compare(current, baseline, threshold=0.10):
+    """[(metric, baseline, current, relative change, regressed)] for metrics in both runs.
+    A change counts as a regression when it is worse than `threshold` (fraction)."""
+    rows = []
+    for name in HIGHER_IS_BETTER + LOWER_IS_BETTER:
+        a, b = baseline.get(name), current.get(name)
+        if a in (None, 0) or b is None:
+            continue
+        change = (b - a) / a
+        worse = -change if name in HIGHER_IS_BETTER else change
+        rows.append((name, a, b, change, worse > threshold))
+    return rows
+
+def print_comparison(rows, baseline_record):
+    print(f"\nvs {baseline_record.get('timestamp')} ({baseline_record.get('commit')}):")
+    for name, a, b, change, regressed in rows:
+        flag = "  REGRESSION" if regressed else ""
+        print(f"  {name:<24} {a:>12.3f} -> {b:>12.3f}  {change:+7.1%}{flag}")
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Offline performance suite")
+    p.add_argument("--model", default=None, help="local model dir / HF name (default: tiny GPT-2 built under .cache/perf)")
+    p.add_argument("--vocab_size", type=int, default=2000)
+    p.add_argument("--n_prompts", type=int, default=32)
+    p.add_argument("--n_texts", type=int, default=2000, help="responses for classification/evaluate throughput")
+    p.add_argument("--prompt_words", type=int, default=40)
+    p.add_argument("--max_new_tokens", type=int, default=32)
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--skip_generate", action="store_true")
+    p.add_argument("--skip_toxicity", action="store_true")
+    p.add_argument("--history", default=HISTORY_PATH)
+    p.add_argument("--no_record", action="store_true", help="don't append this run to the history file")
+    p.add_argument("--compare", action="store_true", help="compare with the latest run of the same config")
+    p.add_argument("--threshold", type=float, default=0.10, help="relative change that counts as a regression")
+    p.add_argument("--fail_on_regression", action="store_true", help="exit 1 if --compare finds a regression")
+    return p.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    config = config_of(args)
+    baseline = next((r for r in reversed(read_history(args.history)) if r.get("config") == config), None)
+
+    model_path, metrics = run_suite(args)
+    record = {"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "commit": _git_commit(),
+              "host": platform.node(), "versions": _versions(), "config": config, "metrics": metrics}
+    print(json.dumps(metrics, indent=2))
+    if not args.no_record:
+        append_history(record, args.history)
+        print(f"Recorded in {args.history}")
+
+    if args.compare:
+        if baseline is None:
+            print("No earlier run with this config to compare against.")
+            return 0
+        rows = compare(metrics, baseline["metrics"], args.threshold)
+        print_comparison(rows, baseline)
+        if any(r[-1] for r in rows):
+            print(f"[WARN] {sum(r[-1] for r in rows)} metric(s) regressed by more than {args.threshold:.0%}")
+            return 1 if args.fail_on_regression else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
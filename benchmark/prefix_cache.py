@@ -0,0 +1,137 @@
+# benchmark/prefix_cache.py
+# Shared-prefix KV cache for templated prompts.
+#
+# Live prompts are built from a handful of templates ("You are a
+# safety-aligned assistant..."), so most of each prompt's prefill is the
+# same preamble. We find token-level prefixes shared by several prompts,
+# run the model over each prefix once, and hand the cached past-key-values
+# to generate() so only the per-prompt suffix is encoded.
+
+import copy
+
+def _common_prefix_len(a, b):
+    n = min(len(a), len(b))
+    i = 0
+    while i < n and a[i] == b[i]:
+        i += 1
+    return i
+
+def find_shared_prefixes(token_lists, min_prefix_tokens=16):
+    """Return a prefix length per prompt (0 = no shared prefix).
+
+    Prompts are grouped by their first `min_prefix_tokens` tokens; inside a
+    group the prefix is the longest run of tokens common to every member.
+    It always stops at least one token short of the shortest prompt so the
+    model has something left to encode before sampling.
+    """
+    groups = {}
+    for i, ids in enumerate(token_lists):
+        if len(ids) > min_prefix_tokens:
+            groups.setdefault(tuple(ids[:min_prefix_tokens]), []).append(i)
+
+    prefix_lens = [0] * len(token_lists)
+    for members in groups.values():
+        if len(members) < 2:
+            continue
+        first = token_lists[members[0]]
+        n = len(first)
+        for i in members[1:]:
+            n = min(n, _common_prefix_len(first, token_lists[i]))
+        n = min(n, min(len(token_lists[i]) for i in members) - 1)
+        if n < min_prefix_tokens:
+            continue
+        for i in members:
+            prefix_lens[i] = n
+    return prefix_lens
+
+def _expand(past, n):
+    # Cache objects (DynamicCache & co.) are copied through their own API:
+    # their legacy-tuple round-trip is not reliable across transformers
+    # releases (5.x DynamicCache yields None layers). Legacy tuples are
+    # expanded tensor by tensor.
+    if hasattr(past, "batch_repeat_interleave"):
+        past = copy.deepcopy(past)
+        if n > 1:
+            past.batch_repeat_interleave(n)
+        return past
+    return tuple(tuple(t.expand(n, *t.shape[1:]).contiguous() for t in layer) for layer in past)
+
+class PrefixCache:
+    """Per-model store of prefix token ids -> past_key_values."""
+
+    def __init__(self, model, min_prefix_tokens=16):
+        self.model = model
+        self.min_prefix_tokens = min_prefix_tokens
+        self._store = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, prefix_ids, batch_size=1):
+        key = tuple(prefix_ids)
+        past = self._store.get(key)
+        if past is None:
+            import torch
+            self.misses += 1
+            with torch.no_grad():
+                out = self.model(torch.tensor([list(key)]), use_cache=True)
+            past = out.past_key_values
+            self._store[key] = past
+        else:
+            self.hits += 1
+        # generate() extends the cache in place, so always hand out a copy
+        return _expand(past, batch_size)
+
+    def clear(self):
+        self._store.clear()
+
+def check_parity(prompts, model, tokenizer, seed=0, max_new_tokens=40, batch_size=8, min_prefix_tokens=16):
+    """Generate `prompts` with and without a PrefixCache under the same seed.
+
+    Returns {"prompts", "cached_prompts", "mismatches": [index, ...]}; the
+    cached path is only correct if `mismatches` is empty.
+    """
+    try:
+        from benchmark.utils import iter_generate
+    except ModuleNotFoundError:
+        from utils import iter_generate
+    cache = PrefixCache(model, min_prefix_tokens)
+    cached = dict(iter_generate(prompts, model, tokenizer, max_new_tokens, batch_size, seed=seed, prefix_cache=cache))
+    plain = dict(iter_generate(prompts, model, tokenizer, max_new_tokens, batch_size, seed=seed))
+    token_lists = tokenizer(list(prompts))["input_ids"]
+    return {"prompts": len(prompts),
+            "cached_prompts": sum(n > 0 for n in find_shared_prefixes(token_lists, min_prefix_tokens)),
+            "mismatches": [i for i in range(len(prompts)) if cached[i] != plain[i]]}
+
+def main(argv=None):
+    # python -m benchmark.prefix_cache --model_name distilgpt2 --seed 3
+    # Wraps the prompts in the live collectors' template (so they share a
+    # preamble) and exits non-zero if the cached and uncached runs differ.
+    import os, sys, argparse
+    repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    if repo_root not in sys.path:
+        sys.path.insert(0, repo_root)
+    from benchmark.utils import load_model, load_prompts
+    from collectors.collectors.templates import build_prompt_from_comment
+
+    p = argparse.ArgumentParser(description="check that --prefix_cache reproduces the uncached outputs")
+    p.add_argument("--model_name", default="distilgpt2")
+    p.add_argument("--dataset_path", default=os.path.join(repo_root, "data", "sample_prompts.csv"))
+    p.add_argument("--limit", type=int, default=16)
+    p.add_argument("--seed", type=int, default=3)
+    p.add_argument("--max_new_tokens", type=int, default=40)
+    p.add_argument("--batch_size", type=int, default=4)
+    p.add_argument("--min_prefix_tokens", type=int, default=4)
+    args = p.parse_args(argv)
+
+    prompts = [build_prompt_from_comment(c) for c in load_prompts(args.dataset_path)[:args.limit]]
+    model, tokenizer = load_model(args.model_name)
+    r = check_parity(prompts, model, tokenizer, seed=args.seed, max_new_tokens=args.max_new_tokens,
+                     batch_size=args.batch_size, min_prefix_tokens=args.min_prefix_tokens)
+    print(f"prefix cache parity: {r['prompts'] - len(r['mismatches'])}/{r['prompts']} identical "
+          f"({r['cached_prompts']} prompts used a cached prefix)")
+    if r["mismatches"] or not r["cached_prompts"]:
+        sys.exit(1)
+    return r
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+# benchmark/quant_parity.py
+# Does int8 dynamic quantization change the benchmark's conclusions?
+#
+#   python -m benchmark.quant_parity --model_name distilgpt2 --seed 0
+#
+# Generates for the same prompts with the same per-prompt seeds twice, first
+# with the fp32 model and then with its int8 dynamically quantized copy, and
+# compares the two runs: classify_response label agreement, class counts,
+# mean Detoxify toxicity (skipped with a warning if Detoxify is missing),
+# generation speedup and weight memory saved. The report goes to
+# results/quant_parity_<model>.json.
+
+import os, sys, json, time, argparse
+import pandas as pd
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(CURRENT_DIR)
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+from benchmark.utils import load_model, iter_generate, load_prompts, quantize_model, model_size_mb
+from benchmark.evaluate import classify_series, score_toxicity
+
+PROMPT_FILE = os.path.join(REPO_ROOT, "data", "sample_prompts.csv")
+
+def _timed_generate(prompts, model, tokenizer, args):
+    out = [None] * len(prompts)
+    # one warm-up batch so the first-call overhead isn't charged to either side
+    for _ in iter_generate(prompts[:args.batch_size], model, tokenizer, max_new_tokens=2,
+                           batch_size=args.batch_size, seed=args.seed):
+        pass
+    t = time.perf_counter()
+    for i, text in iter_generate(prompts, model, tokenizer, max_new_tokens=args.max_new_tokens,
+                                 batch_size=args.batch_size, seed=args.seed):
+        out[i] = text
+    return out, time.perf_counter() - t
+
+def _side(responses, seconds, size_mb, threshold):
+    resp = pd.Series(responses, dtype=object).fillna("").astype(str)
+    labels, _ = classify_series(resp)
+    tox, tox_label = score_toxicity(resp, threshold=threshold)
+    tox = pd.to_numeric(tox, errors="coerce")
+    return {"generate_s": round(seconds, 3), "prompts_per_s": round(len(resp) / seconds, 3) if seconds else None,
+            "weights_mb": round(size_mb, 2),
+            "counts": {str(k): int(v) for k, v in labels.value_counts().items()},
+            "mean_toxicity": None if tox.isna().all() else round(float(tox.mean()), 5),
+            "_labels": labels, "_tox": tox, "_tox_label": tox_label}
+
+def parity_report(fp32, int8, responses_fp32, responses_int8):
+    agree = float((fp32["_labels"] == int8["_labels"]).mean())
+    report = {"label_agreement": round(agree, 4),
+              "identical_responses": round(sum(a == b for a, b in zip(responses_fp32, responses_int8))
+                                           / max(len(responses_fp32), 1), 4),
+              "speedup": round(fp32["generate_s"] / int8["generate_s"], 3) if int8["generate_s"] else None,
+              "memory_saved_mb": round(fp32["weights_mb"] - int8["weights_mb"], 2),
+              "memory_saved_pct": round(100.0 * (1 - int8["weights_mb"] / fp32["weights_mb"]), 1),
+              "mean_toxicity_diff": None, "tox_label_agreement": None}
+    if fp32["mean_toxicity"] is not None and int8["mean_toxicity"] is not None:
+        report["mean_toxicity_diff"] = round(int8["mean_toxicity"] - fp32["mean_toxicity"], 5)
+        report["tox_label_agreement"] = round(float((fp32["_tox_label"] == int8["_tox_label"]).mean()), 4)
+    return report
+
+def format_parity(r):
+    fp32, int8 = r["fp32"], r["int8"]
+    lines = [f"Quantization parity: {r['model']} ({r['prompts']} prompts, seed {r['seed']}, "
+             f"{r['max_new_tokens']} new tokens)",
+             f"{'':<22}{'fp32':>12}{'int8':>12}",
+             f"{'generate s':<22}{fp32['generate_s']:>12}{int8['generate_s']:>12}",
+             f"{'weights MB':<22}{fp32['weights_mb']:>12}{int8['weights_mb']:>12}",
+             f"{'mean toxicity':<22}{str(fp32['mean_toxicity']):>12}{str(int8['mean_toxicity']):>12}"]
+    for label in sorted(set(fp32["counts"]) | set(int8["counts"])):
+        lines.append(f"{label:<22}{fp32['counts'].get(label, 0):>12}{int8['counts'].get(label, 0):>12}")
+    lines.append(f"label agreement {100 * r['label_agreement']:.1f}%, identical responses "
+                 f"{100 * r['identical_responses']:.1f}%, speedup {r['speedup']}x, "
+                 f"memory saved {r['memory_saved_mb']} MB ({r['memory_saved_pct']}%)")
+    if r["mean_toxicity_diff"] is not None:
+        lines.append(f"mean toxicity diff {r['mean_toxicity_diff']:+}, "
+                     f"tox label agreement {100 * r['tox_label_agreement']:.1f}%")
+    return "\n".join(lines)
+
+def run(args):
+    prompts = load_prompts(args.dataset_path)
+    if args.limit:
+        prompts = prompts[:args.limit]
+    model, tokenizer = load_model(args.model_name, revision=args.model_revision)
+    out_fp32, s_fp32 = _timed_generate(prompts, model, tokenizer, args)
+    size_fp32 = model_size_mb(model)
+    qmodel = quantize_model(model, "int8", inplace=True)  # the fp32 side is done
+    out_int8, s_int8 = _timed_generate(prompts, qmodel, tokenizer, args)
+
+    fp32 = _side(out_fp32, s_fp32, size_fp32, args.tox_threshold)
+    int8 = _side(out_int8, s_int8, model_size_mb(qmodel), args.tox_threshold)
+    report = {"model": args.model_name, "prompts": len(prompts), "seed": args.seed,
+              "max_new_tokens": args.max_new_tokens, "batch_size": args.batch_size,
+              **parity_report(fp32, int8, out_fp32, out_int8),
+              "fp32": {k: v for k, v in fp32.items() if not k.startswith("_")},
+              "int8": {k: v for k, v in int8.items() if not k.startswith("_")}}
+    os.makedirs(os.path.dirname(os.path.abspath(args.report)), exist_ok=True)
+    with open(args.report, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(format_parity(report))
+    print(f"Report: {args.report}")
+    return report
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="fp32 vs int8 dynamic quantization parity report")
+    p.add_argument("--model_name", default="distilgpt2")
+    p.add_argument("--model_revision", default=None)
+    p.add_argument("--dataset_path", default=PROMPT_FILE)
+    p.add_argument("--limit", type=int, default=None, help="only the first N prompts")
+    p.add_argument("--max_new_tokens", type=int, default=80)
+    p.add_argument("--batch_size", type=int, default=8)
+    p.add_argument("--seed", type=int, default=0, help="per-prompt seeds shared by both runs")
+    p.add_argument("--tox_threshold", type=float, default=0.5)
+    p.add_argument("--report", default=None, help="default: results/quant_parity_<model>.json")
+    args = p.parse_args(argv)
+    if args.report is None:
+        args.report = os.path.join(REPO_ROOT, "results", f"quant_parity_{args.model_name.replace('/', '_')}.json")
+    return args
+
+def main(argv=None):
+    return run(parse_args(argv))
+
+if __name__ == "__main__":
+    main()
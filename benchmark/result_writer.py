@@ -0,0 +1,107 @@
+# benchmark/result_writer.py
+# Append-only, crash-resumable writer for generation results.
+#
+# Rows go to "<output>.partial.jsonl" as they are produced (one JSON object
+# per line, so multi-line responses can't tear a record). Every
+# `flush_every` rows the file is flushed and fsync'd. On restart the partial
+# file is replayed and prompts already answered are skipped; a half-written
+# last line from a crash is cut off. finalize() writes the usual
+# prompt,response file (CSV, or Parquet for a .parquet output) in prompt
+# order and removes the partial file.
+
+import os, json
+import pandas as pd
+
+try:
+    from benchmark.results_store import save_results
+except ModuleNotFoundError:
+    from results_store import save_results
+
+class ResultWriter:
+    def __init__(self, output_path, prompts, flush_every=10, resume=True):
+        self.output_path = output_path
+        self.partial_path = output_path + ".partial.jsonl"
+        self.prompts = prompts
+        self.flush_every = flush_every
+        self.done = set()
+        self._unflushed = 0
+
+        os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+        if resume and os.path.exists(self.partial_path):
+            self._replay()
+        elif os.path.exists(self.partial_path):
+            os.remove(self.partial_path)
+        self._fh = open(self.partial_path, "a", encoding="utf-8")
+
+    def _replay(self):
+        keep, dirty = [], False
+        with open(self.partial_path, "rb") as f:
+            for line in f:
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    row = None
+                if row is None or not line.endswith(b"\n"):
+                    dirty = True
+                    break  # torn write: drop it and everything after
+                i = row.get("index")
+                # only trust rows that still line up with the current dataset
+                if isinstance(i, int) and 0 <= i < len(self.prompts) and self.prompts[i] == row.get("prompt"):
+                    self.done.add(i)
+                    keep.append(line)
+                else:
+                    dirty = True
+        if dirty:
+            with open(self.partial_path, "wb") as f:
+                f.writelines(keep)
+        if self.done:
+            print(f"Resuming: {len(self.done)}/{len(self.prompts)} prompts already done ({self.partial_path})")
+
+    def pending(self):
+        return [i for i in range(len(self.prompts)) if i not in self.done]
+
+    def completed(self):
+        """{index: response} for the rows already written (e.g. replayed on resume)."""
+        self._fh.flush()
+        out = {}
+        with open(self.partial_path, encoding="utf-8") as f:
+            for line in f:
+                row = json.loads(line)
+                out[row["index"]] = row["response"]
+        return out
+
+    def write(self, index, response, **extra):
+        """`extra` (e.g. stop_reason, new_tokens) become additional result columns."""
+        rec = {"index": index, "prompt": self.prompts[index], "response": response, **extra}
+        self._fh.write(json.dumps(rec, ensure_ascii=False) + "\n")
+        self.done.add(index)
+        self._unflushed += 1
+        if self._unflushed >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        self._fh.flush()
+        os.fsync(self._fh.fileno())
+        self._unflushed = 0
+
+    def close(self):
+        if not self._fh.closed:
+            self.flush()
+            self._fh.close()
+
+    def finalize(self, allow_missing=False):
+        """Write the final results file (prompt order) and drop the partial file.
+        With allow_missing, prompts without a response are left out of it."""
+        self.close()
+        missing = len(self.prompts) - len(self.done)
+        if missing and not allow_missing:
+            raise RuntimeError(f"{missing} prompts have no response yet; rerun to resume")
+        if os.path.getsize(self.partial_path) == 0:  # nothing written (e.g. no prompts)
+            df = pd.DataFrame(columns=["index", "prompt", "response"])
+        else:
+            df = pd.read_json(self.partial_path, lines=True, dtype=False)
+        df = df.drop_duplicates("index", keep="last").sort_values("index")
+        extra = [c for c in df.columns if c not in ("index", "prompt", "response")]
+        save_results(df[["prompt", "response", *extra]], self.output_path)
+        os.remove(self.partial_path)
+        return self.output_path
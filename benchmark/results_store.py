@@ -0,0 +1,116 @@
+# benchmark/results_store.py
+# Columnar (Parquet) results format with CSV import/export.
+#
+# generate_response() returns the prompt followed by the completion, so a
+# plain prompt,response file stores every prompt twice. Both formats instead
+# keep the prompt once plus a `completion` column and an `echo` flag (whether
+# the response started with the prompt), and `response` is rebuilt on read
+# only when it is asked for. Parquet also dictionary-encodes the prompt and
+# label columns; its reads are memory-mapped and, like CSV reads, can be
+# restricted to a few columns, e.g. load_results(p, ["classification"]).
+#
+# Every function dispatches on the file extension. Older prompt,response
+# files (and any CSV with a `response` column) load unchanged.
+
+import os, argparse
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # optional: CSV keeps working without it
+    pa = pq = None
+
+CATEGORICAL = ("classification", "tox_label", "matched_keyword")
+
+def is_columnar(path):
+    return str(path).endswith(".parquet")
+
+def _require_arrow():
+    if pq is None:
+        raise ImportError("pyarrow is required for .parquet results (pip install pyarrow)")
+
+def _split_response(df):
+    # prompt,response,... -> prompt,completion,echo,...
+    if "response" not in df.columns or "prompt" not in df.columns:
+        return df
+    df = df.copy()
+    prompt = df["prompt"].fillna("").astype(str)
+    response = df["response"].fillna("").astype(str)
+    echo = [r.startswith(p) for p, r in zip(prompt, response)]
+    pos = df.columns.get_loc("response")
+    df = df.drop(columns=["response"])
+    df.insert(pos, "echo", echo)
+    df.insert(pos, "completion", [r[len(p):] if e else r for p, r, e in zip(prompt, response, echo)])
+    return df
+
+def _to_table(df):
+    df = _split_response(df)
+    for col in ("prompt",) + CATEGORICAL:
+        if col in df.columns:
+            df[col] = df[col].astype("category")
+    return pa.Table.from_pandas(df, preserve_index=False)
+
+def _columns_to_read(names, columns):
+    if columns is None:
+        return None
+    names = set(names)
+    wanted = []
+    for c in columns:
+        if c == "response" and "response" not in names:
+            wanted += ["prompt", "completion", "echo"]
+        else:
+            wanted.append(c)
+    return [c for c in dict.fromkeys(wanted) if c in names]
+
+def load_results(path, columns=None):
+    """Read a results file (.csv or .parquet), optionally only `columns`."""
+    if not is_columnar(path):
+        usecols = _columns_to_read(pd.read_csv(path, nrows=0).columns, columns)
+        df = pd.read_csv(path, usecols=usecols)
+    else:
+        _require_arrow()
+        table = pq.read_table(path, columns=_columns_to_read(pq.read_schema(path).names, columns), memory_map=True)
+        df = table.to_pandas()
+        for col in ("prompt",) + CATEGORICAL:
+            if col in df.columns and isinstance(df[col].dtype, pd.CategoricalDtype):
+                df[col] = df[col].astype(object)
+    if "completion" in df.columns and (columns is None or "response" in columns):
+        prefix = df["prompt"].fillna("").astype(str)
+        if "echo" in df.columns:
+            prefix = prefix.where(df["echo"].astype(bool), "")
+        df["response"] = prefix + df["completion"].fillna("").astype(str)
+        df = df.drop(columns=[c for c in ("completion", "echo") if c in df.columns])
+        # keep the familiar prompt,response,... column order
+        lead = [c for c in ("prompt", "response") if c in df.columns]
+        df = df[lead + [c for c in df.columns if c not in lead]]
+    if columns is not None:
+        df = df[[c for c in columns if c in df.columns]]
+    return df
+
+def save_results(df, path):
+    """Write results atomically as .csv or .parquet depending on `path`."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = path + ".tmp"
+    if is_columnar(path):
+        _require_arrow()
+        pq.write_table(_to_table(df), tmp, compression="zstd")
+    else:
+        _split_response(df).to_csv(tmp, index=False)
+    os.replace(tmp, path)
+    return path
+
+def convert(src, dst):
+    """CSV <-> Parquet conversion (direction taken from the extensions)."""
+    return save_results(load_results(src), dst)
+
+def main():
+    p = argparse.ArgumentParser(description="Convert results between CSV and Parquet")
+    p.add_argument("src")
+    p.add_argument("dst")
+    args = p.parse_args()
+    convert(args.src, args.dst)
+    print(f"Wrote {args.dst} ({os.path.getsize(args.dst)} bytes, source {os.path.getsize(args.src)} bytes)")
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,7 @@
 # benchmark/run_benchmark.py
 # Created by Vineeth Animireddy
 
-import os, sys, pandas as pd
+import os, sys, json, argparse, pandas as pd
 
 CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
 REPO_ROOT = os.path.dirname(CURRENT_DIR)
@@ -9,18 +9,43 @@ if REPO_ROOT not in sys.path:
     sys.path.insert(0, REPO_ROOT)
 
 try:
-    from benchmark.utils import load_model, generate_response, load_prompts
-    from benchmark.evaluate import evaluate_results
+    from benchmark.utils import (load_model, generate_response, iter_generate, load_prompts, format_load_stats,
+                                 QUANTIZE_MODES)
+    from benchmark.evaluate import evaluate_results, classify_response
+    from benchmark.adaptive import AdaptiveSampler, format_summary as format_adaptive
+    from benchmark.prefix_cache import PrefixCache
+    from benchmark.sharding import iter_sharded
+    from benchmark.result_writer import ResultWriter
+    from benchmark.gen_cache import GenerationCache, model_revision, SAMPLING
+    from benchmark.early_stop import VerdictStop
+    from benchmark.assisted import AssistedDecoder
+    from benchmark import tracing
+    from benchmark import daemon as bench_daemon
+    from benchmark.sweep import run_sweep, format_report
 except ModuleNotFoundError:
     # Fallback (still works if someone runs from inside benchmark/)
     if CURRENT_DIR not in sys.path:
         sys.path.insert(0, CURRENT_DIR)
     import utils
     import evaluate as _evaluate
+    from prefix_cache import PrefixCache
+    from sharding import iter_sharded
+    from result_writer import ResultWriter
+    from gen_cache import GenerationCache, model_revision, SAMPLING
+    from early_stop import VerdictStop
+    from assisted import AssistedDecoder
+    import tracing
+    import daemon as bench_daemon
+    from sweep import run_sweep, format_report
     load_model = utils.load_model
     generate_response = utils.generate_response
+    iter_generate = utils.iter_generate
     load_prompts = utils.load_prompts
+    format_load_stats = utils.format_load_stats
+    QUANTIZE_MODES = utils.QUANTIZE_MODES
     evaluate_results = _evaluate.evaluate_results
+    classify_response = _evaluate.classify_response
+    from adaptive import AdaptiveSampler, format_summary as format_adaptive
     
 #1st model
 #MODEL_NAME = "gpt2"
@@ -33,22 +58,367 @@ PROMPT_FILE = os.path.join(REPO_ROOT, "data", "sample_prompts.csv")
 RESULT_FILE = os.path.join(REPO_ROOT, "results", "distilgpt2_outputs.csv")
 
 
-def run():
-    print(f"Running benchmark with model: {MODEL_NAME}")
-    prompts = load_prompts(PROMPT_FILE)
-    model, tokenizer = load_model(MODEL_NAME)
+def _reject(p, mode, conflicts, why=None):
+    """p.error() if any (flag, set) in `conflicts` is set alongside `mode`."""
+    bad = [flag for flag, on in conflicts if on]
+    if bad:
+        p.error(f"{', '.join(bad)} not supported with {mode}" + (f" ({why})" if why else ""))
 
-    os.makedirs(os.path.dirname(RESULT_FILE), exist_ok=True)
-    rows = []
-    for prompt in prompts:
-        print(f"> {prompt}")
-        resp = generate_response(prompt, model, tokenizer)
-        print(f"< {resp[:200]}\n")
-        rows.append({"prompt": prompt, "response": resp})
 
-    pd.DataFrame(rows).to_csv(RESULT_FILE, index=False)
-    print(f"✅ Saved: {RESULT_FILE}")
-    evaluate_results(RESULT_FILE)
+def parse_args(argv=None):
+    p = argparse.ArgumentParser()
+    g = p.add_argument_group("model and data")
+    g.add_argument("--model_name", default=MODEL_NAME)
+    g.add_argument("--model_revision", default=None, help="hub branch/tag/commit to load")
+    g.add_argument("--dataset_path", default=PROMPT_FILE)
+    g.add_argument("--output_path", default=None,
+                   help="default: results/<model>_outputs.csv (<model>_int8_outputs.csv with --quantize int8)")
+    g.add_argument("--quantize", choices=QUANTIZE_MODES, default=None,
+                   help="dynamic int8 quantization of the linear layers (CPU); see benchmark.quant_parity")
+
+    g = p.add_argument_group("generation")
+    g.add_argument("--max_new_tokens", type=int, default=80)
+    g.add_argument("--batch_size", type=int, default=1,
+                   help="prompts per generate() call; 1 keeps the original one-by-one loop")
+    g.add_argument("--max_batch_tokens", type=int, default=None,
+                   help="cap on rows x (prompt + new tokens) per batch")
+    g.add_argument("--seed", type=int, default=None,
+                   help="per-prompt seeded sampling; outputs no longer depend on batching")
+    g.add_argument("--greedy", action="store_true", help="argmax decoding instead of sampling")
+    g.add_argument("--prefix_cache", action="store_true",
+                   help="encode shared prompt preambles once and reuse their KV cache")
+    g.add_argument("--min_prefix_tokens", type=int, default=16)
+
+    g = p.add_argument_group("execution")
+    g.add_argument("--workers", type=int, default=1,
+                   help="generate in N worker processes, each with its own copy of the model")
+    g.add_argument("--threads_per_worker", type=int, default=None,
+                   help="torch intra-op threads per worker (default: cores // workers)")
+    g.add_argument("--daemon", choices=["auto", "on", "off"], default="auto",
+                   help="submit generation/evaluation to a running benchmark.daemon (BENCH_DAEMON_URL); "
+                        "auto = only if one answers (generation stays local with --batch_size, "
+                        "--max_batch_tokens or --prefix_cache), on = fail if none does")
+    g.add_argument("--flush_every", type=int, default=10,
+                   help="fsync the partial results file every N rows")
+    g.add_argument("--no_resume", action="store_true",
+                   help="ignore a partial results file from an interrupted run")
+    g.add_argument("--gen_cache", default=None,
+                   help="SQLite response cache, e.g. .cache/generations.sqlite (requires --seed)")
+    g.add_argument("--gen_cache_mb", type=int, default=256, help="LRU size limit for --gen_cache")
+
+    g = p.add_argument_group("diagnostics")
+    g.add_argument("--trace", default=None,
+                   help="write a Chrome trace (JSON) of per-stage timings here and print a summary table; "
+                        "with --workers > 1 generation inside the workers shows up as one span")
+    g.add_argument("--profile", default=None,
+                   help="sample the generation loop's stack and write folded stacks here (flamegraph input)")
+    g.add_argument("--profile_interval", type=float, default=0.005, help="seconds between --profile samples")
+
+    g = p.add_argument_group("early stopping (in this process only)")
+    g.add_argument("--early_stop", nargs="?", const="unsafe", default=None,
+                   help="stop each sequence once its verdict is one of these (comma-separated, default: unsafe); "
+                        "records stop_reason / new_tokens / tokens_saved columns")
+    g.add_argument("--early_stop_every", type=int, default=1, help="check the verdict every N new tokens")
+
+    g = p.add_argument_group("assisted generation (in this process, one prompt at a time)")
+    g.add_argument("--assistant_model", default=None,
+                   help="draft model for assisted (speculative) generation, e.g. sshleifer/tiny-gpt2; "
+                        "must share the target's tokenizer")
+    g.add_argument("--lookahead", type=int, default=4, help="draft tokens proposed per target forward pass")
+
+    g = p.add_argument_group("adaptive sampling (in rounds, in this process)")
+    g.add_argument("--adaptive", action="store_true",
+                   help="stratified sequential sampling: generate prompts in random order per stratum and stop "
+                        "each stratum once its unsafe/refusal rate intervals are narrower than --ci_width")
+    g.add_argument("--strata", default="category,source", help="columns to stratify on")
+    g.add_argument("--ci_width", type=float, default=0.1, help="target interval width per stratum")
+    g.add_argument("--confidence", type=float, default=0.95, help="interval confidence level")
+    g.add_argument("--min_per_stratum", type=int, default=20, help="draws before a stratum may stop")
+    g.add_argument("--adaptive_batch", type=int, default=16, help="prompts generated between interval checks")
+    g.add_argument("--summary_path", default=os.path.join(REPO_ROOT, "results", "summary_all.json"),
+                   help="estimates go under <model> -> adaptive here")
+
+    g = p.add_argument_group("evaluation")
+    g.add_argument("--tox_cascade", default=None,
+                   help="calibrated toxicity cascade (python -m benchmark.tox_cascade calibrate); only rows in its "
+                        "uncertainty band are scored with Detoxify")
+    g.add_argument("--tox_band", default=None, help="--tox_cascade: lo,hi band override")
+
+    g = p.add_argument_group("multi-model sweep (in this process)")
+    g.add_argument("--models", default=None,
+                   help="comma-separated models to sweep over the same prompts, each optionally pinned as "
+                        "name@revision; writes results/<model>_outputs.csv for each (not with --model_name, "
+                        "--model_revision, --output_path, --workers, --gen_cache, --daemon on, --quantize, "
+                        "--greedy, --early_stop, --assistant_model, --adaptive or --profile)")
+    g.add_argument("--memory_budget_mb", type=float, default=None,
+                   help="max estimated MB of models resident at once (default: half of RAM)")
+    g.add_argument("--sweep_report", default=os.path.join(REPO_ROOT, "results", "sweep_report.json"))
+    args = p.parse_args(argv)
+
+    if args.gen_cache and args.seed is None:
+        p.error("--gen_cache requires --seed: unseeded samples can't be reused")
+    # modes that generate in their own loop here; those the daemon can't serve switch it off
+    if args.models:
+        _reject(p, "--models", [("--model_name", args.model_name != p.get_default("model_name")),
+                                ("--model_revision", args.model_revision is not None),
+                                ("--output_path", args.output_path is not None),
+                                ("--workers", args.workers > 1),
+                                ("--gen_cache", args.gen_cache is not None),
+                                ("--daemon on", args.daemon == "on"),
+                                ("--quantize", args.quantize is not None),
+                                ("--greedy", args.greedy),
+                                ("--early_stop", args.early_stop is not None),
+                                ("--assistant_model", args.assistant_model is not None),
+                                ("--adaptive", args.adaptive),
+                                ("--profile", args.profile is not None)],
+                "the sweep writes results/<model>_outputs.csv itself; pin revisions as name@revision")
+        args.daemon = "off"
+    if args.early_stop:
+        args.early_stop = tuple(v.strip() for v in args.early_stop.split(",") if v.strip())
+        _reject(p, "--early_stop", [("--workers", args.workers > 1), ("--daemon on", args.daemon == "on")])
+        args.daemon = "off"
+    if args.adaptive:
+        _reject(p, "--adaptive", [("--workers", args.workers > 1)])
+    if args.assistant_model:
+        _reject(p, "--assistant_model", [("--workers", args.workers > 1), ("--early_stop", bool(args.early_stop)),
+                                         ("--prefix_cache", args.prefix_cache),
+                                         ("--daemon on", args.daemon == "on")])
+        args.daemon = "off"
+    if args.quantize or args.greedy:
+        _reject(p, "--quantize / --greedy", [("--daemon on", args.daemon == "on")],
+                "the daemon serves fp32 models with sampling")
+        args.daemon = "off"
+    if args.tox_band:
+        if not args.tox_cascade:
+            p.error("--tox_band requires --tox_cascade")
+        try:
+            lo, hi = (float(v) for v in args.tox_band.split(","))
+        except ValueError:
+            p.error(f"--tox_band must be lo,hi (got {args.tox_band!r})")
+        if not 0 <= lo <= hi <= 1:
+            p.error(f"--tox_band needs 0 <= lo <= hi <= 1 (got {args.tox_band})")
+        args.tox_band = (lo, hi)
+    # generation settings the daemon doesn't take (it batches across clients itself)
+    args.local_gen_flags = [f for f, on in (("--batch_size", args.batch_size != p.get_default("batch_size")),
+                                            ("--max_batch_tokens", args.max_batch_tokens is not None),
+                                            ("--prefix_cache", args.prefix_cache)) if on]
+    if args.daemon == "on":
+        _reject(p, "--daemon on", [(f, True) for f in args.local_gen_flags], "use --daemon off or auto")
+    if args.output_path is None:
+        safe_name = args.model_name.replace("/", "_") + (f"_{args.quantize}" if args.quantize else "")
+        args.output_path = os.path.join(REPO_ROOT, "results", f"{safe_name}_outputs.csv")
+    return args
+
+
+def run(argv=None):
+    args = parse_args(argv)
+    if args.models:
+        return sweep(args)
+    args.daemon_url = args.daemon_results_dir = None
+    if args.daemon != "off" and args.workers == 1:
+        if bench_daemon.is_running():
+            if args.local_gen_flags:
+                print(f"[WARN] benchmark daemon at {bench_daemon.daemon_url()} ignores "
+                      f"{', '.join(args.local_gen_flags)}; generating in this process instead")
+            else:
+                url = bench_daemon.daemon_url()
+                status = bench_daemon.health(url)
+                problems = bench_daemon.mismatches(status, args.model_name, args.model_revision,
+                                                   quantize=args.quantize, greedy=args.greedy)
+                if problems:
+                    sys.exit(f"Benchmark daemon at {url} would not generate what this run asks for: "
+                             f"{'; '.join(problems)}. Restart it or pass --daemon off")
+                args.daemon_url, args.daemon_results_dir = url, status.get("results_dir")
+                print(f"Using benchmark daemon at {args.daemon_url}")
+        elif args.daemon == "on":
+            sys.exit(f"No benchmark daemon answering at {bench_daemon.daemon_url()}")
+    if args.trace:
+        tracing.enable()
+    try:
+        _run(args)
+    finally:
+        if args.trace:
+            tracing.export_chrome(args.trace)
+            print("\n=== Stage timings ===")
+            print(tracing.summary_table())
+            print(f"Trace written to {args.trace}")
+            tracing.disable()
+
+
+def _run(args):
+    print(f"Running benchmark with model: {args.model_name}")
+    with tracing.span("load_prompts"):
+        frame = pd.read_csv(args.dataset_path) if args.adaptive else None
+        prompts = frame["prompt"].astype(str).tolist() if args.adaptive else load_prompts(args.dataset_path)
+        writer = ResultWriter(args.output_path, prompts, flush_every=args.flush_every, resume=not args.no_resume)
+        pending = writer.pending()
+
+    sampler = None
+    if args.adaptive:
+        sampler = AdaptiveSampler(frame, strata=args.strata.split(","), target_width=args.ci_width,
+                                  confidence=args.confidence, min_per_stratum=args.min_per_stratum,
+                                  seed=args.seed or 0)
+        for i, resp in writer.completed().items():
+            sampler.record(i, classify_response(resp))
+
+    cache = None
+    if args.gen_cache and pending:
+        cache = GenerationCache(args.gen_cache, max_bytes=args.gen_cache_mb * 1024 * 1024)
+        revision = model_revision(args.model_name, args.model_revision)
+        sampling = dict(SAMPLING, quantize=args.quantize) if args.quantize else SAMPLING
+        if args.greedy:
+            sampling = dict(sampling, greedy=True)
+        if args.assistant_model:  # assisted seeded draws differ from plain seeded generation
+            sampling = dict(sampling, assistant_model=args.assistant_model, lookahead=args.lookahead)
+        if args.early_stop:  # early-stopped responses are truncated: keep them apart
+            sampling = dict(sampling, early_stop=sorted(args.early_stop), early_stop_every=args.early_stop_every)
+    keys = {}
+
+    def write(i, resp, **extra):
+        with tracing.span("write_row"):
+            writer.write(i, resp, **extra)
+            if cache is not None and extra.get("stop_reason") != "cached":
+                cache.put(keys[i], resp)
+            if sampler is not None:
+                sampler.record(i, classify_response(resp))
+
+    def from_cache(batch):
+        # write the cached rows, return the ones still to generate
+        if cache is None:
+            return batch
+        with tracing.span("gen_cache_lookup", rows=len(batch)):
+            for i in batch:
+                keys[i] = cache.make_key(args.model_name, revision, prompts[i], args.max_new_tokens, args.seed,
+                                         sampling=sampling)
+            hits = cache.get_many([keys[i] for i in batch])
+        tracing.counter("gen_cache_hits", len(hits))
+        for i in batch:
+            if keys[i] in hits:
+                # the cache keeps only the text, not how generation ended
+                write(i, hits[keys[i]], **({"stop_reason": "cached"} if args.early_stop else {}))
+        return [i for i in batch if keys[i] not in hits]
+
+    if sampler is not None:
+        batches = iter(lambda: sampler.next_batch(args.adaptive_batch, skip=writer.done), [])
+    else:
+        batches = [pending] if pending else []
+    args.stopper = args.assist = None
+    generate = None
+    try:
+        with tracing.span("generation_loop", prompts=len(pending)), \
+             tracing.profile(args.profile, args.profile_interval):
+            for batch in batches:
+                batch = from_cache(batch)
+                if not batch:
+                    continue
+                if generate is None:
+                    generate = _generator(args)
+                todo = [prompts[i] for i in batch]
+                for j, resp in generate(todo):
+                    print(f"> {todo[j]}")
+                    print(f"< {resp[:200]}\n")
+                    stop = args.stopper.records.pop(j, {}) if args.stopper is not None else {}
+                    write(batch[j], resp, **stop)
+    finally:
+        writer.close()
+        if args.stopper is not None:
+            print(args.stopper.summary())
+        if args.assist is not None:
+            print(args.assist.summary())
+        if cache is not None:
+            cache.evict()
+            print("Generation cache:", cache.stats())
+            cache.close()
+
+    with tracing.span("finalize_results"):
+        # adaptive runs leave the skipped prompts out of the results file
+        writer.finalize(allow_missing=sampler is not None)
+    print(f"✅ Saved: {args.output_path}")
+    with tracing.span("evaluate"):
+        # the daemon only rewrites files under its own results directory
+        if args.daemon_results_dir and bench_daemon.path_allowed(args.output_path, args.daemon_results_dir):
+            print("Evaluation (daemon):", bench_daemon.evaluate_remote(args.output_path, url=args.daemon_url,
+                                                                       tox_cascade=args.tox_cascade,
+                                                                       tox_band=args.tox_band))
+        else:
+            evaluate_results(args.output_path, tox_cascade=args.tox_cascade, tox_band=args.tox_band)
+    if sampler is not None:
+        _write_adaptive_summary(args, sampler.summary())
+
+
+def _write_adaptive_summary(args, summary):
+    print(format_adaptive(summary))
+    # same model key as .github/scripts/eval_and_publish.py, which keeps this entry
+    name = os.path.basename(args.output_path)
+    model = name.rsplit("_outputs.", 1)[0] if "_outputs." in name else os.path.splitext(name)[0]
+    data = {}
+    if os.path.exists(args.summary_path):
+        with open(args.summary_path, encoding="utf-8") as f:
+            data = json.load(f)
+    data.setdefault(model, {})["adaptive"] = summary
+    os.makedirs(os.path.dirname(os.path.abspath(args.summary_path)), exist_ok=True)
+    with open(args.summary_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+    print(f"Adaptive estimates written to {args.summary_path} [{model}][adaptive]")
+
+
+def sweep(args):
+    models = [m.strip() for m in args.models.split(",") if m.strip()]
+    print(f"Sweeping {len(models)} models: {', '.join(models)}")
+    if args.trace:
+        tracing.enable()
+    prompts = load_prompts(args.dataset_path)
+    report = run_sweep(models, prompts, budget_mb=args.memory_budget_mb,
+                       results_dir=os.path.join(REPO_ROOT, "results"),
+                       max_new_tokens=args.max_new_tokens, batch_size=args.batch_size,
+                       max_batch_tokens=args.max_batch_tokens, seed=args.seed, prefix_cache=args.prefix_cache,
+                       min_prefix_tokens=args.min_prefix_tokens, flush_every=args.flush_every,
+                       resume=not args.no_resume, report_path=args.sweep_report,
+                       on_done=lambda name, path: evaluate_results(path, tox_cascade=args.tox_cascade,
+                                                                   tox_band=args.tox_band))
+    print(format_report(report))
+    print(f"Sweep report: {args.sweep_report}")
+    if args.trace:
+        tracing.export_chrome(args.trace)
+        print(tracing.summary_table())
+        tracing.disable()
+
+
+def _generator(args):
+    """Return generate(prompts) -> iterator of (index, response); a local model is loaded once, here."""
+    if args.daemon_url:
+        # the daemon batches (and coalesces with other clients) on its own
+        return lambda prompts: bench_daemon.generate_remote(prompts, args.model_name, revision=args.model_revision,
+                                                            max_new_tokens=args.max_new_tokens, seed=args.seed,
+                                                            url=args.daemon_url)
+    if args.workers > 1:
+        return lambda prompts: iter_sharded(prompts, args.model_name, args.workers, args.threads_per_worker,
+                            prefix_cache=args.prefix_cache, min_prefix_tokens=args.min_prefix_tokens,
+                            revision=args.model_revision, quantize=args.quantize,
+                            max_new_tokens=args.max_new_tokens, batch_size=args.batch_size,
+                            max_batch_tokens=args.max_batch_tokens, seed=args.seed, greedy=args.greedy)
+    model, tokenizer = load_model(args.model_name, revision=args.model_revision, quantize=args.quantize)
+    print(format_load_stats())
+    prefix_cache = PrefixCache(model, args.min_prefix_tokens) if args.prefix_cache else None
+    if args.assistant_model:
+        draft, _ = load_model(args.assistant_model, revision=None)
+        print(format_load_stats())
+        args.assist = AssistedDecoder(model, tokenizer, draft, lookahead=args.lookahead)
+        if args.batch_size > 1:
+            print("[WARN] assisted generation runs one prompt at a time; ignoring --batch_size")
+        return lambda prompts: ((i, args.assist.generate(p, max_new_tokens=args.max_new_tokens, seed=args.seed,
+                                                         greedy=args.greedy))
+                                for i, p in enumerate(prompts))
+    if args.early_stop:
+        args.stopper = VerdictStop(tokenizer, final=args.early_stop, check_every=args.early_stop_every)
+    if args.batch_size > 1 or args.seed is not None or prefix_cache is not None or args.stopper is not None:
+        return lambda prompts: iter_generate(prompts, model, tokenizer, max_new_tokens=args.max_new_tokens,
+                                             batch_size=args.batch_size, max_batch_tokens=args.max_batch_tokens,
+                                             seed=args.seed, prefix_cache=prefix_cache, early_stop=args.stopper,
+                                             greedy=args.greedy)
+    return lambda prompts: ((i, generate_response(p, model, tokenizer, max_new_tokens=args.max_new_tokens,
+                                                  seed=args.seed, greedy=args.greedy))
+                            for i, p in enumerate(prompts))
 
 if __name__ == "__main__":
     run()
@@ -0,0 +1,59 @@
+# benchmark/sharding.py
+# Multi-process generation: split the prompt list across worker processes.
+#
+# Each worker loads the model once (in the pool initializer) and pins torch
+# to its share of the cores, so N workers x T threads never exceeds the
+# machine. Prompts are handed out in small chunks, so a slow shard doesn't
+# leave the other workers idle. Results come back tagged with their original
+# index so the caller can put them back in prompt order.
+
+import os
+import multiprocessing as mp
+
+_worker = {}
+
+def _init_worker(model_name, revision, threads, gen_kwargs, prefix_cache, min_prefix_tokens, quantize=None):
+    import torch
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass  # already set in this process
+    from benchmark.utils import load_model
+    from benchmark.prefix_cache import PrefixCache
+    model, tokenizer = load_model(model_name, revision=revision, quantize=quantize)
+    _worker.update(
+        model=model, tokenizer=tokenizer, gen_kwargs=gen_kwargs,
+        prefix_cache=PrefixCache(model, min_prefix_tokens) if prefix_cache else None,
+    )
+
+def _run_chunk(chunk):
+    from benchmark.utils import iter_generate
+    indices = [i for i, _ in chunk]
+    texts = [p for _, p in chunk]
+    gen = iter_generate(texts, _worker["model"], _worker["tokenizer"],
+                        prefix_cache=_worker["prefix_cache"], **_worker["gen_kwargs"])
+    return [(indices[j], resp) for j, resp in gen]
+
+def split_chunks(items, workers, batch_size=1):
+    # ~4 chunks per worker for load balancing, never smaller than one batch
+    size = max(batch_size, -(-len(items) // (workers * 4)))
+    return [items[k:k + size] for k in range(0, len(items), size)]
+
+def iter_sharded(prompts, model_name, workers, threads_per_worker=None, prefix_cache=False,
+                 min_prefix_tokens=16, revision=None, quantize=None, **gen_kwargs):
+    """Yield (index, response) pairs as worker chunks complete.
+
+    `gen_kwargs` are passed through to utils.iter_generate (max_new_tokens,
+    batch_size, max_batch_tokens, seed). Use a seed if sharded output has to
+    match a single-process run exactly.
+    """
+    if threads_per_worker is None:
+        threads_per_worker = max(1, (os.cpu_count() or 1) // workers)
+    chunks = split_chunks(list(enumerate(prompts)), workers, gen_kwargs.get("batch_size", 1))
+    ctx = mp.get_context("spawn")  # fork + torch threads can deadlock
+    with ctx.Pool(workers, initializer=_init_worker,
+                  initargs=(model_name, revision, threads_per_worker, gen_kwargs, prefix_cache, min_prefix_tokens,
+                            quantize)) as pool:
+        for results in pool.imap_unordered(_run_chunk, chunks):
+            yield from results
@@ -0,0 +1,239 @@
+# benchmark/sweep.py
+# Multi-model sweep under a memory budget.
+#
+# All models run over the same prompt file, so the prompts are read once
+# and tokenized once per tokenizer family (distilgpt2 and gpt2 share one).
+# Each model's resident size is estimated before loading (exact parameter
+# count from its config, plus headroom for activations / KV cache); models
+# start as soon as their estimate fits next to the ones already resident,
+# and run concurrently in threads (torch releases the GIL inside kernels).
+# The cores are shared out between the models running at the time: each
+# model thread sets its own torch intra-op thread count (thread-local under
+# OpenMP) to cores // running, re-checked between generated rows, so
+# concurrent models don't oversubscribe the CPU.
+# Finished models stay loaded until the space is needed, then the least
+# recently used idle one is unloaded first. A model bigger than the whole
+# budget runs alone.
+#
+# Output is the usual results/<model>_outputs.csv per model (via
+# ResultWriter, so an interrupted sweep resumes) plus a timing report.
+# A model may be pinned to a hub revision as "name@revision"; its results
+# then go to results/<model>@<revision>_outputs.csv.
+
+import os, gc, json, time, hashlib, threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+try:
+    from benchmark.utils import load_model, iter_generate
+    from benchmark.prefix_cache import PrefixCache
+    from benchmark.result_writer import ResultWriter
+    from benchmark import tracing
+except ModuleNotFoundError:
+    from utils import load_model, iter_generate
+    from prefix_cache import PrefixCache
+    from result_writer import ResultWriter
+    import tracing
+
+HEADROOM = 1.25   # resident size ~ weights x HEADROOM + HEADROOM_MB while generating
+HEADROOM_MB = 64
+
+# from_pretrained(low_cpu_mem_usage=True) patches nn.Module globally while it
+# builds the model, so two loads at once can leave one with uninitialised
+# weights. Loads take turns; generation runs concurrently.
+_LOAD_LOCK = threading.Lock()
+
+def default_budget_mb():
+    """Half of the machine's physical memory."""
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") / 2 / 2**20
+    except (ValueError, OSError, AttributeError):
+        return 4096
+
+def estimate_mb(model_name, revision=None):
+    """Expected resident MB, from an exact parameter count on the meta device."""
+    import torch
+    from transformers import AutoConfig, AutoModelForCausalLM
+    cfg = AutoConfig.from_pretrained(model_name, revision=revision)
+    # torch's own meta device: no weights are allocated, and unlike
+    # accelerate.init_empty_weights it needs no optional dependency
+    with torch.device("meta"):
+        m = AutoModelForCausalLM.from_config(cfg)
+    nbytes = sum(p.numel() * p.element_size() for p in m.parameters())
+    return nbytes / 2**20 * HEADROOM + HEADROOM_MB
+
+def _share_threads(cores, running):
+    import torch
+    n = max(1, cores // max(1, running))
+    if torch.get_num_threads() != n:
+        torch.set_num_threads(n)
+    return n
+
+def resident_mb(model):
+    return sum(t.numel() * t.element_size() for t in list(model.parameters()) + list(model.buffers())) / 2**20
+
+def tokenizer_family(tokenizer):
+    """Hash of the vocabulary/merges: models with the same family share token ids."""
+    if getattr(tokenizer, "is_fast", False):
+        blob = tokenizer.backend_tokenizer.to_str()
+    else:
+        blob = json.dumps(sorted(tokenizer.get_vocab().items()))
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()[:16]
+
+def split_revision(spec):
+    """"name@revision" -> (name, revision); a bare name -> (name, None)."""
+    name, _, revision = spec.partition("@")
+    return name, revision or None
+
+def output_path_for(model_name, results_dir):
+    return os.path.join(results_dir, f"{model_name.replace('/', '_')}_outputs.csv")
+
+class _Resident:
+    """LRU set of loaded models with the MB reserved for each."""
+
+    def __init__(self, budget_mb):
+        self.budget_mb = budget_mb
+        self.models = OrderedDict()   # name -> {"model", "tokenizer", "mb", "busy"}
+        self.reserved = 0.0
+        self.evicted = []
+
+    def fits(self, mb):
+        idle = sum(e["mb"] for e in self.models.values() if not e["busy"])
+        return self.reserved - idle + mb <= self.budget_mb
+
+    def make_room(self, mb):
+        for name in [n for n, e in self.models.items() if not e["busy"]]:
+            if self.reserved + mb <= self.budget_mb:
+                break
+            self.reserved -= self.models.pop(name)["mb"]
+            self.evicted.append(name)
+            gc.collect()
+
+def run_sweep(models, prompts, budget_mb=None, results_dir="results", max_new_tokens=80, batch_size=8,
+              max_batch_tokens=None, seed=None, prefix_cache=False, min_prefix_tokens=16, flush_every=10,
+              resume=True, report_path=None, on_done=None):
+    """Generate for every model in `models` ("name" or "name@revision"); returns the timing report dict.
+    `on_done(model_name, output_path)` is called on the caller's thread as each model finishes."""
+    from transformers import AutoTokenizer
+    models = list(dict.fromkeys(models))
+    budget_mb = budget_mb or default_budget_mb()
+    t_start = time.perf_counter()
+    report = {"budget_mb": round(budget_mb), "prompts": len(prompts), "models": {}, "families": {}}
+
+    # tokenizers are small: load all of them, group by family, tokenize once per family
+    # (and hand them to load_model later instead of loading them again)
+    token_ids, families, tokenizers = {}, {}, {}
+    for name in models:
+        model_name, revision = split_revision(name)
+        tok = tokenizers[name] = AutoTokenizer.from_pretrained(model_name, revision=revision)
+        fam = tokenizer_family(tok)
+        families.setdefault(fam, []).append(name)
+        if fam not in token_ids:
+            t = time.perf_counter()
+            with tracing.span("tokenize", family=fam, rows=len(prompts)):
+                token_ids[fam] = tok(list(prompts))["input_ids"]
+            report["families"][fam] = {"models": [], "tokenize_s": round(time.perf_counter() - t, 3)}
+        report["families"][fam]["models"].append(name)
+        report["models"][name] = {"family": fam, "estimate_mb": round(estimate_mb(model_name, revision), 1)}
+    family_of = {name: fam for fam, names in families.items() for name in names}
+
+    resident = _Resident(budget_mb)
+    lock = threading.Lock()
+    active = {"now": 0, "max": 0}
+    cores = os.cpu_count() or 1
+
+    def run_one(name):
+        rec = report["models"][name]
+        entry = resident.models[name]
+        rec["start_s"] = round(time.perf_counter() - t_start, 3)
+        with lock:
+            active["now"] += 1
+            active["max"] = max(active["max"], active["now"])
+        try:
+            if entry["model"] is None:
+                t = time.perf_counter()
+                with _LOAD_LOCK:
+                    model_name, revision = split_revision(name)
+                    entry["model"], entry["tokenizer"] = load_model(model_name, revision=revision,
+                                                                    tokenizer=tokenizers[name])
+                rec["load_s"] = round(time.perf_counter() - t, 3)
+                rec["resident_mb"] = round(resident_mb(entry["model"]), 1)
+            out_path = output_path_for(name, results_dir)
+            writer = ResultWriter(out_path, prompts, flush_every=flush_every, resume=resume)
+            pending = writer.pending()
+            ids = token_ids[family_of[name]]
+            cache = PrefixCache(entry["model"], min_prefix_tokens) if prefix_cache else None
+            t = time.perf_counter()
+            rec["threads"] = [_share_threads(cores, active["now"])]
+            try:
+                with tracing.span("sweep_generate", model=name, prompts=len(pending)):
+                    for j, resp in iter_generate([prompts[i] for i in pending], entry["model"], entry["tokenizer"],
+                                                 max_new_tokens=max_new_tokens, batch_size=batch_size,
+                                                 max_batch_tokens=max_batch_tokens, seed=seed, prefix_cache=cache,
+                                                 token_lists=[ids[i] for i in pending]):
+                        writer.write(pending[j], resp)
+                        n = _share_threads(cores, active["now"])
+                        if n != rec["threads"][-1]:
+                            rec["threads"].append(n)
+            finally:
+                writer.close()
+            writer.finalize()
+            gen_s = time.perf_counter() - t
+            rec.update(generated=len(pending), generate_s=round(gen_s, 3),
+                       prompts_per_s=round(len(pending) / gen_s, 3) if pending and gen_s > 0 else None)
+            return name, out_path
+        finally:
+            rec["end_s"] = round(time.perf_counter() - t_start, 3)
+            with lock:
+                active["now"] -= 1
+
+    queue_ = list(models)
+    with ThreadPoolExecutor(max_workers=len(models) or 1) as ex:
+        running = {}
+        while queue_ or running:
+            # start everything that fits, in order; a model bigger than the budget runs alone
+            while queue_:
+                name = queue_[0]
+                mb = report["models"][name]["estimate_mb"]
+                loaded = name in resident.models
+                if not loaded and not resident.fits(mb) and (running or mb <= budget_mb):
+                    break
+                if not loaded:
+                    resident.make_room(mb)
+                    if mb > budget_mb:
+                        print(f"[WARN] {name} needs ~{mb:.0f} MB, more than the {budget_mb:.0f} MB budget; running it alone")
+                    resident.models[name] = {"model": None, "tokenizer": None, "mb": mb, "busy": True}
+                    resident.reserved += mb
+                resident.models[name]["busy"] = True
+                resident.models.move_to_end(name)
+                running[ex.submit(run_one, name)] = name
+                queue_.pop(0)
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for fut in done:
+                name = running.pop(fut)
+                resident.models[name]["busy"] = False
+                name, out_path = fut.result()
+                print(f"✅ {name}: {out_path}")
+                if on_done is not None:
+                    on_done(name, out_path)
+
+    report.update(wall_s=round(time.perf_counter() - t_start, 3), max_concurrent=active["max"], cores=cores,
+                  evicted=resident.evicted)
+    if report_path:
+        os.makedirs(os.path.dirname(os.path.abspath(report_path)), exist_ok=True)
+        with open(report_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    return report
+
+def format_report(report):
+    lines = [f"Sweep: {len(report['models'])} models, {report['prompts']} prompts, budget {report['budget_mb']} MB, "
+             f"wall {report['wall_s']}s, max {report['max_concurrent']} concurrent on {report.get('cores')} cores",
+             f"{'model':<28}{'est MB':>8}{'MB':>8}{'load s':>8}{'gen s':>8}{'p/s':>8}{'start':>8}{'end':>8}"
+             f"  threads"]
+    for name, r in report["models"].items():
+        lines.append(f"{name:<28}{r['estimate_mb']:>8.0f}{r.get('resident_mb', 0):>8.0f}{r.get('load_s', 0):>8.2f}"
+                     f"{r.get('generate_s', 0):>8.2f}{(r.get('prompts_per_s') or 0):>8.2f}"
+                     f"{r.get('start_s', 0):>8.2f}{r.get('end_s', 0):>8.2f}  {'/'.join(map(str, r.get('threads', [])))}")
+    for fam, f in report["families"].items():
+        lines.append(f"tokenizer {fam}: {', '.join(f['models'])} (tokenized once in {f['tokenize_s']}s)")
+    return "\n".join(lines)
@@ -0,0 +1,87 @@
+# benchmark/toxicity.py
+# Process-wide Detoxify scorer with a persistent score cache.
+#
+# The Detoxify model is loaded at most once per process (and only if some
+# text actually needs scoring), texts are scored in bounded chunks so peak
+# memory doesn't grow with the dataset, and every score is memoized on disk
+# by a hash of (variant, text) so re-evaluating unchanged outputs is free.
+
+import os, hashlib, sqlite3, importlib.util
+
+try:
+    from benchmark import tracing
+except ModuleNotFoundError:
+    import tracing
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_CACHE = os.path.join(REPO_ROOT, ".cache", "toxicity.sqlite")
+
+_scorers = {}
+
+def text_key(variant, text):
+    return hashlib.sha256(f"{variant}\0{text}".encode("utf-8")).hexdigest()
+
+class ToxicityScorer:
+    def __init__(self, variant="original", chunk_size=64, cache_path=DEFAULT_CACHE):
+        self.variant = variant
+        self.chunk_size = chunk_size
+        self._model = None
+        self._db = None
+        if cache_path:
+            os.makedirs(os.path.dirname(os.path.abspath(cache_path)), exist_ok=True)
+            self._db = sqlite3.connect(cache_path)
+            self._db.execute("CREATE TABLE IF NOT EXISTS scores (key TEXT PRIMARY KEY, toxicity REAL NOT NULL)")
+            self._db.commit()
+        self.cache_hits = 0
+        self.scored = 0
+
+    @property
+    def model(self):
+        if self._model is None:
+            from detoxify import Detoxify
+            with tracing.span("detoxify_load", variant=self.variant):
+                self._model = Detoxify(self.variant)
+        return self._model
+
+    def _lookup(self, keys):
+        found = {}
+        if self._db is None:
+            return found
+        for k in range(0, len(keys), 500):
+            chunk = keys[k:k + 500]
+            marks = ",".join("?" * len(chunk))
+            found.update(self._db.execute(f"SELECT key, toxicity FROM scores WHERE key IN ({marks})", chunk))
+        return found
+
+    def score(self, texts):
+        """Return a toxicity score per text (same order as `texts`)."""
+        texts = ["" if t is None else str(t) for t in texts]
+        keys = [text_key(self.variant, t) for t in texts]
+        uniq = dict(zip(keys, texts))
+        scores = self._lookup(list(uniq))
+        self.cache_hits += len(scores)
+        tracing.counter("toxicity_cache_hits", len(scores))
+
+        todo = [k for k in uniq if k not in scores]
+        for k in range(0, len(todo), self.chunk_size):
+            chunk = todo[k:k + self.chunk_size]
+            model = self.model
+            with tracing.span("detoxify_predict", rows=len(chunk)):
+                preds = model.predict([uniq[key] for key in chunk])["toxicity"]
+            fresh = dict(zip(chunk, (float(p) for p in preds)))
+            scores.update(fresh)
+            self.scored += len(fresh)
+            if self._db is not None:
+                self._db.executemany("INSERT OR REPLACE INTO scores VALUES (?, ?)", fresh.items())
+                self._db.commit()
+        return [scores[k] for k in keys]
+
+def detoxify_installed():
+    """Whether Detoxify can be imported, without importing it (or torch)."""
+    return importlib.util.find_spec("detoxify") is not None
+
+def get_scorer(variant="original", **kwargs):
+    """Shared scorer for this process (one Detoxify load per variant)."""
+    if variant not in _scorers:
+        _scorers[variant] = ToxicityScorer(variant, **kwargs)
+    return _scorers[variant]
@@ -0,0 +1,193 @@
+# benchmark/tracing.py
+# Lightweight spans / counters for the benchmark pipeline.
+#
+# Tracing is off by default: span() then returns a shared no-op context
+# manager and counter() returns immediately, so instrumented code costs one
+# function call per stage. enable() starts collecting; export_chrome()
+# writes a Chrome trace (open in chrome://tracing or ui.perfetto.dev) and
+# summary_table() aggregates time per stage.
+#
+#   from benchmark import tracing
+#   with tracing.span("generate", batch=8):
+#       ...
+#   tracing.counter("new_tokens", 80)
+#
+# StackSampler / profile() is an optional sampling profiler for hot loops:
+# it periodically records the stack of one thread and writes folded stacks
+# (flamegraph.pl / speedscope format).
+
+import os, sys, json, time, threading
+from collections import Counter
+
+_enabled = False
+_t0 = 0
+_events = []
+_stats = {}       # name -> [calls, total_ns, max_ns]
+_counters = {}
+_lock = threading.Lock()
+
+class _NoopSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NOOP = _NoopSpan()
+
+class _Span:
+    __slots__ = ("name", "args", "start")
+
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        end = time.perf_counter_ns()
+        dur = end - self.start
+        ev = {"name": self.name, "ph": "X", "ts": (self.start - _t0) / 1000, "dur": dur / 1000,
+              "pid": os.getpid(), "tid": threading.get_ident()}
+        if self.args:
+            ev["args"] = self.args
+        with _lock:
+            _events.append(ev)
+            st = _stats.setdefault(self.name, [0, 0, 0])
+            st[0] += 1
+            st[1] += dur
+            st[2] = max(st[2], dur)
+        return False
+
+def enabled():
+    return _enabled
+
+def enable():
+    """Start collecting (clears anything collected before)."""
+    global _enabled, _t0
+    with _lock:
+        _events.clear()
+        _stats.clear()
+        _counters.clear()
+        _t0 = time.perf_counter_ns()
+        _enabled = True
+
+def disable():
+    global _enabled
+    _enabled = False
+
+def span(name, **args):
+    """Context manager timing one stage; free when tracing is disabled."""
+    if not _enabled:
+        return _NOOP
+    return _Span(name, args)
+
+def counter(name, value=1):
+    """Add `value` to a named counter (e.g. prompts, new_tokens, cache hits)."""
+    if not _enabled:
+        return
+    with _lock:
+        total = _counters[name] = _counters.get(name, 0) + value
+        _events.append({"name": name, "ph": "C", "ts": (time.perf_counter_ns() - _t0) / 1000,
+                        "pid": os.getpid(), "args": {name: total}})
+
+def counters():
+    return dict(_counters)
+
+def export_chrome(path):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with _lock:
+        data = {"traceEvents": list(_events), "displayTimeUnit": "ms",
+                "otherData": {"counters": dict(_counters)}}
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    return path
+
+def summary_rows():
+    """[(stage, calls, total_s, mean_ms, max_ms, pct_of_wall)] sorted by total time.
+    Spans nest (e.g. generate inside generation_loop), so percentages can add up past 100."""
+    wall = max(time.perf_counter_ns() - _t0, 1)
+    rows = [(name, calls, total / 1e9, total / calls / 1e6, mx / 1e6, 100.0 * total / wall)
+            for name, (calls, total, mx) in _stats.items()]
+    return sorted(rows, key=lambda r: -r[2])
+
+def summary_table():
+    lines = [f"{'stage':<22}{'calls':>8}{'total s':>10}{'mean ms':>10}{'max ms':>10}{'% wall':>8}"]
+    for name, calls, total, mean, mx, pct in summary_rows():
+        lines.append(f"{name:<22}{calls:>8}{total:>10.3f}{mean:>10.2f}{mx:>10.2f}{pct:>7.1f}%")
+    for name, value in sorted(_counters.items()):
+        lines.append(f"{name:<22}{value:>8}")
+    return "\n".join(lines)
+
+class StackSampler:
+    """Sampling profiler for one thread (default: the caller's).
+
+    A daemon thread wakes every `interval` seconds and records the target
+    thread's Python stack; write() stores the samples as folded stacks.
+    """
+
+    def __init__(self, interval=0.005, thread_id=None):
+        self.interval = interval
+        self.thread_id = thread_id or threading.get_ident()
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if stack:
+                self.samples[";".join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def top(self, n=15):
+        """Leaf functions with the most samples: [(function, samples)]."""
+        leaves = Counter()
+        for stack, k in self.samples.items():
+            leaves[stack.rsplit(";", 1)[-1]] += k
+        return leaves.most_common(n)
+
+    def write(self, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, k in self.samples.most_common():
+                f.write(f"{stack} {k}\n")
+        return path
+
+class profile:
+    """`with profile("trace.folded"):` samples the current thread; no-op if path is None."""
+
+    def __init__(self, path, interval=0.005):
+        self.path = path
+        self.sampler = StackSampler(interval) if path else None
+
+    def __enter__(self):
+        if self.sampler:
+            self.sampler.start()
+        return self.sampler
+
+    def __exit__(self, *exc):
+        if self.sampler:
+            self.sampler.stop()
+            self.sampler.write(self.path)
+            total = sum(self.sampler.samples.values())
+            print(f"Profile: {total} samples -> {self.path}")
+            for fn, k in self.sampler.top(10):
+                print(f"  {100.0 * k / max(total, 1):5.1f}%  {fn}")
+        return False
@@ -1,21 +1,282 @@
 # benchmark/utils.py
 # Created by Vineeth Animireddy
 
-from transformers import AutoTokenizer, AutoModelForCausalLM
-import torch, pandas as pd
+# torch / transformers are imported inside the functions that need them:
+# importing them takes seconds, and run_benchmark imports this module even
+# when there is nothing left to generate.
 
-def load_model(model_name="gpt2"):
-    tok = AutoTokenizer.from_pretrained(model_name)
-    mdl = AutoModelForCausalLM.from_pretrained(model_name)
-    mdl.eval()
+import hashlib, importlib.util, resource, sys, time
+import pandas as pd
+
+try:
+    from benchmark.prefix_cache import find_shared_prefixes
+    from benchmark import tracing
+except ModuleNotFoundError:
+    from prefix_cache import find_shared_prefixes
+    import tracing
+
+# Filled by load_model(): import_s / tokenizer_s / weights_s / peak_rss_mb / source
+LOAD_STATS = {}
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far, in MB."""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+def _from_local_cache(loader, model_name, **kwargs):
+    # Try the local HF cache first: no hub round-trips on a warm cache.
+    try:
+        return loader(model_name, local_files_only=True, **kwargs), "local cache"
+    except OSError:
+        return loader(model_name, **kwargs), "hub"
+
+QUANTIZE_MODES = ("int8",)
+
+def _conv1d_to_linear(model):
+    # GPT-2 blocks use transformers' Conv1D (y = x @ W + b, W stored [in, out]),
+    # which quantize_dynamic doesn't recognise; swap in equivalent nn.Linear.
+    import torch.nn as nn
+    from transformers.pytorch_utils import Conv1D
+    for parent in list(model.modules()):
+        for name, child in list(parent.named_children()):
+            if isinstance(child, Conv1D):
+                lin = nn.Linear(child.weight.shape[0], child.weight.shape[1], device="meta")
+                lin.weight = nn.Parameter(child.weight.data.t().contiguous(), requires_grad=False)
+                lin.bias = nn.Parameter(child.bias.data, requires_grad=False)
+                setattr(parent, name, lin)
+
+def quantize_model(model, mode="int8", inplace=False):
+    """Dynamic quantization for CPU inference: nn.Linear weights (attention,
+    MLP and the LM head) are stored as int8, activations are quantized on the
+    fly per batch. Embeddings and layer norms stay fp32.
+
+    The quantized copy is returned and `model` is left as it was, unless
+    inplace=True, which converts `model` itself (no second copy in memory;
+    don't use `model` afterwards)."""
+    import copy
+    import warnings
+    import torch
+    if mode not in QUANTIZE_MODES:
+        raise ValueError(f"unknown quantize mode {mode!r}; expected one of {QUANTIZE_MODES}")
+    if not inplace:
+        model = copy.deepcopy(model)
+    _conv1d_to_linear(model)
+    with warnings.catch_warnings():
+        # eager-mode quantization is deprecated upstream but still the only
+        # CPU int8 path that needs no extra dependency
+        warnings.simplefilter("ignore", DeprecationWarning)
+        warnings.simplefilter("ignore", UserWarning)
+        return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+
+def model_size_mb(model):
+    """Serialized state_dict size; unlike parameters() it counts packed int8 weights."""
+    import io
+    import torch
+    buf = io.BytesIO()
+    torch.save(model.state_dict(), buf)
+    return buf.tell() / 2**20
+
+def load_model(model_name="gpt2", revision=None, cache_dir=None, quantize=None, tokenizer=None):
+    # tokenizer: one the caller already loaded for this model, returned as is
+    t0 = time.perf_counter()
+    with tracing.span("import_transformers"):
+        import torch  # noqa: F401
+        from transformers import AutoTokenizer, AutoModelForCausalLM
+    t1 = time.perf_counter()
+    tok = tokenizer
+    if tok is None:
+        with tracing.span("load_tokenizer", model=model_name):
+            tok, _ = _from_local_cache(AutoTokenizer.from_pretrained, model_name,
+                                       revision=revision, cache_dir=cache_dir)
+    t2 = time.perf_counter()
+    # safetensors checkpoints are memory-mapped; low_cpu_mem_usage builds the
+    # model on the meta device and fills it from the mapped file instead of
+    # allocating random weights first (it needs accelerate).
+    low_mem = importlib.util.find_spec("accelerate") is not None
+    with tracing.span("load_model", model=model_name):
+        mdl, source = _from_local_cache(AutoModelForCausalLM.from_pretrained, model_name, revision=revision,
+                                        cache_dir=cache_dir, low_cpu_mem_usage=low_mem)
+        mdl.eval()
+    t3 = time.perf_counter()
+    if quantize:
+        with tracing.span("quantize", mode=quantize):
+            mdl = quantize_model(mdl, quantize, inplace=True)
+    LOAD_STATS.update(model=model_name, source=source, low_cpu_mem_usage=low_mem, quantize=quantize,
+                      import_s=round(t1 - t0, 3), tokenizer_s=round(t2 - t1, 3),
+                      weights_s=round(t3 - t2, 3), quantize_s=round(time.perf_counter() - t3, 3),
+                      peak_rss_mb=round(peak_rss_mb(), 1))
     return mdl, tok
 
-def generate_response(prompt, model, tokenizer, max_new_tokens=80):
-    inp = tokenizer(prompt, return_tensors="pt")
-    with torch.no_grad():
-        out = model.generate(**inp, max_new_tokens=max_new_tokens, do_sample=True)
-    return tokenizer.decode(out[0], skip_special_tokens=True)
+def format_load_stats(stats=None):
+    s = stats or LOAD_STATS
+    return (f"Model load ({s.get('model')}, {s.get('source')}): import {s.get('import_s')}s, "
+            f"tokenizer {s.get('tokenizer_s')}s, weights {s.get('weights_s')}s, "
+            + (f"quantize {s.get('quantize')} {s.get('quantize_s')}s, " if s.get("quantize") else "")
+            + f"peak RSS {s.get('peak_rss_mb')} MB")
+
+def generate_response(prompt, model, tokenizer, max_new_tokens=80, seed=None, greedy=False):
+    # seed=None keeps the historical unseeded sampling; with a seed the
+    # output is reproducible and identical to the batched path. greedy=True
+    # takes the argmax at every step instead of sampling.
+    import torch
+    with tracing.span("tokenize"):
+        inp = tokenizer(prompt, return_tensors="pt")
+    with tracing.span("generate", rows=1), torch.no_grad():
+        out = model.generate(**inp, max_new_tokens=max_new_tokens, **_sampling_kwargs([prompt], seed, greedy))
+    tracing.counter("prompts")
+    tracing.counter("new_tokens", out.shape[1] - inp["input_ids"].shape[1])
+    with tracing.span("decode"):
+        return tokenizer.decode(out[0], skip_special_tokens=True)
+
+def _prepare_for_batching(model, tokenizer):
+    # GPT-2 family has no pad token and must be left-padded for generation,
+    # otherwise new tokens get appended after the padding.
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+    tokenizer.padding_side = "left"
+    if getattr(model.generation_config, "pad_token_id", None) is None:
+        model.generation_config.pad_token_id = tokenizer.pad_token_id
+
+def bucket_by_length(lengths, batch_size=8, max_batch_tokens=None, max_new_tokens=0):
+    """Group indices into batches of similar token length.
+
+    Indices are sorted by length so each batch pads to a near-uniform width.
+    A batch is closed once it holds `batch_size` prompts or once its padded
+    footprint (rows x (longest prompt + max_new_tokens)) would exceed
+    `max_batch_tokens`.
+    """
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i])
+    batches, cur, cur_max = [], [], 0
+    for i in order:
+        width = max(cur_max, lengths[i]) + max_new_tokens
+        too_many = len(cur) >= batch_size
+        too_big = max_batch_tokens and cur and width * (len(cur) + 1) > max_batch_tokens
+        if cur and (too_many or too_big):
+            batches.append(cur)
+            cur, cur_max = [], 0
+        cur.append(i)
+        cur_max = max(cur_max, lengths[i])
+    if cur:
+        batches.append(cur)
+    return batches
+
+def row_seed(seed, prompt):
+    """Per-prompt seed, so a sample does not depend on which batch it lands in."""
+    digest = hashlib.sha256(f"{seed}:{prompt}".encode("utf-8")).hexdigest()
+    return int(digest[:15], 16)
+
+def sampling_probs(scores, top_k=50, temperature=1.0):
+    """The distribution generate()'s default sampling draws from: temperature,
+    then top-k, then softmax over the last dimension."""
+    import torch
+    scores = scores.float() / temperature
+    if top_k and top_k < scores.shape[-1]:
+        kth = torch.topk(scores, top_k, dim=-1).values[..., -1:]
+        scores = scores.masked_fill(scores < kth, float("-inf"))
+    return torch.softmax(scores, dim=-1)
+
+class SeededSampler:
+    """Top-k sampling with one torch.Generator per row.
+
+    generate(do_sample=True) draws every row from the global RNG, so a row's
+    output changes with batch size, ordering and padding. This processor does
+    the sampling itself and returns a one-hot score row, so generate() is run
+    greedily and simply picks the sampled token. It mirrors the default
+    sampling setup of generate() (top_k=50, temperature=1). It is a plain
+    callable (LogitsProcessorList only needs __call__), so defining it does
+    not import transformers.
+    """
+
+    def __init__(self, seeds, top_k=50, temperature=1.0):
+        import torch
+        self.generators = [torch.Generator().manual_seed(s) for s in seeds]
+        self.top_k = top_k
+        self.temperature = temperature
+
+    def __call__(self, input_ids, scores):
+        import torch
+        probs = sampling_probs(scores, self.top_k, self.temperature)
+        picked = torch.stack([torch.multinomial(probs[r], 1, generator=g)
+                              for r, g in enumerate(self.generators)])
+        out = torch.full_like(scores, float("-inf"), dtype=torch.float)
+        return out.scatter_(1, picked, 0.0)
+
+def _sampling_kwargs(prompts, seed, greedy=False):
+    if greedy:
+        return {"do_sample": False}
+    if seed is None:
+        return {"do_sample": True}
+    from transformers import LogitsProcessorList
+    sampler = SeededSampler([row_seed(seed, p) for p in prompts])
+    return {"do_sample": False, "logits_processor": LogitsProcessorList([sampler])}
+
+def _prefix_batch(ids_list, prefix_len, pad_id):
+    # [prefix][pad ... pad][suffix]: the padding sits between the cached prefix
+    # and each suffix, and is masked out. GPT-2 derives position ids from the
+    # attention mask, so every suffix continues at position prefix_len.
+    import torch
+    width = max(len(ids) for ids in ids_list)
+    input_ids, mask = [], []
+    for ids in ids_list:
+        gap = width - len(ids)
+        input_ids.append(ids[:prefix_len] + [pad_id] * gap + ids[prefix_len:])
+        mask.append([1] * prefix_len + [0] * gap + [1] * (len(ids) - prefix_len))
+    return torch.tensor(input_ids), torch.tensor(mask)
+
+def iter_generate(prompts, model, tokenizer, max_new_tokens=80, batch_size=8, max_batch_tokens=None,
+                  seed=None, prefix_cache=None, token_lists=None, early_stop=None, greedy=False):
+    """Yield (index, response) pairs, one length bucket at a time.
+
+    With a `prefix_cache`, prompts sharing a templated preamble are batched
+    together and generation resumes from the cached preamble state.
+    Prompts are tokenized once up front; pass `token_lists` (this tokenizer's
+    ids for `prompts`) to reuse a tokenization shared with other models.
+    `early_stop` (early_stop.VerdictStop) retires rows whose safety verdict
+    is settled; its `records[index]` is filled before that index is yielded.
+    """
+    import torch
+    _prepare_for_batching(model, tokenizer)
+    if token_lists is None:
+        with tracing.span("tokenize", rows=len(prompts)):
+            token_lists = tokenizer(list(prompts))["input_ids"]
+    if prefix_cache is not None:
+        prefix_lens = find_shared_prefixes(token_lists, prefix_cache.min_prefix_tokens)
+    else:
+        prefix_lens = [0] * len(prompts)
+
+    groups = {}
+    for i, n in enumerate(prefix_lens):
+        groups.setdefault(tuple(token_lists[i][:n]), []).append(i)
+
+    for prefix, members in groups.items():
+        lengths = [len(token_lists[i]) - len(prefix) for i in members]
+        for batch in bucket_by_length(lengths, batch_size, max_batch_tokens, max_new_tokens):
+            batch = [members[j] for j in batch]
+            texts = [prompts[i] for i in batch]
+            if prefix:
+                input_ids, mask = _prefix_batch([token_lists[i] for i in batch], len(prefix),
+                                                tokenizer.pad_token_id)
+                with tracing.span("prefix_cache"):
+                    past = prefix_cache.get(prefix, len(batch))
+                inp = {"input_ids": input_ids, "attention_mask": mask, "past_key_values": past}
+            else:
+                with tracing.span("pad", rows=len(batch)):
+                    inp = tokenizer.pad({"input_ids": [token_lists[i] for i in batch]}, return_tensors="pt")
+            kwargs = _sampling_kwargs(texts, seed, greedy)
+            if early_stop is not None:
+                from transformers import StoppingCriteriaList
+                early_stop.start(batch, inp["input_ids"].shape[1])
+                kwargs["stopping_criteria"] = StoppingCriteriaList([early_stop])
+            with tracing.span("generate", rows=len(batch), width=int(inp["input_ids"].shape[1])), torch.no_grad():
+                out = model.generate(**inp, max_new_tokens=max_new_tokens, **kwargs)
+            if early_stop is not None:
+                early_stop.finish(out, max_new_tokens)
+            tracing.counter("prompts", len(batch))
+            tracing.counter("new_tokens", (out.shape[1] - inp["input_ids"].shape[1]) * len(batch))
+            with tracing.span("decode", rows=len(batch)):
+                texts = tokenizer.batch_decode(out, skip_special_tokens=True)
+            for i, text in zip(batch, texts):
+                yield i, text
 
 def load_prompts(path):
     return pd.read_csv(path)["prompt"].astype(str).tolist()
-
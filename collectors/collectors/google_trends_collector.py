@@ -2,7 +2,7 @@
 import os, csv
 from datetime import datetime
 from pytrends.request import TrendReq
-from collectors.templates import categorize, expected_behavior_for_category
+from collectors.collectors.templates import categorize, expected_behavior_for_category
 
 def trending_terms(region="IN", top_n=20):
     pt = TrendReq(hl="en-US", tz=0)
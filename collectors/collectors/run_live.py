@@ -1,7 +1,11 @@
 # collectors/run_live.py
 import os, sys, argparse
-from collectors.youtube_collector import collect_youtube
-from collectors.google_trends_collector import collect_trends
+from datetime import datetime
+import pandas as pd
+from collectors.collectors.youtube_collector import collect_youtube
+from collectors.collectors.youtube_fake import FakeYouTube
+from collectors.collectors.google_trends_collector import collect_trends
+from collectors.live_store import LiveStore
 
 def main():
     p = argparse.ArgumentParser()
@@ -11,8 +15,21 @@ def main():
     p.add_argument("--per_video_comments", type=int, default=30)
     p.add_argument("--max_videos", type=int, default=5)
     p.add_argument("--top_n", type=int, default=20, help="for trends")
+    p.add_argument("--workers", type=int, default=8, help="videos fetched concurrently")
+    p.add_argument("--qps", type=float, default=5.0, help="YouTube API calls per second")
+    p.add_argument("--quota_budget", type=int, default=int(os.getenv("YT_QUOTA_BUDGET", "10000")),
+                   help="stop once this many API quota units are spent")
     p.add_argument("--out", default=None)
+    p.add_argument("--fake", action="store_true", default=os.getenv("YOUTUBE_FAKE") == "1",
+                   help="collect from the offline YouTube stand-in (youtube_fake.py); no API key needed")
+    p.add_argument("--near_dup_index", default=os.getenv("NEAR_DUP_INDEX"),
+                   help="persistent near-duplicate index (e.g. data/live/near_dup.sqlite)")
+    p.add_argument("--near_dup_threshold", type=float, default=float(os.getenv("NEAR_DUP_THRESHOLD", "0.8")))
+    p.add_argument("--store", default=None,
+                   help="also write the rows to this partitioned store (e.g. data/live_store); "
+                        "replaces today's partitions for the same sources")
     args = p.parse_args()
+    date = datetime.utcnow().strftime("%Y%m%d")
 
     if args.source == "youtube":
         path = collect_youtube(
@@ -20,12 +37,22 @@ def main():
             region=args.region,
             per_video_comments=args.per_video_comments,
             max_videos=args.max_videos,
-            out_csv=args.out
+            out_csv=args.out,
+            workers=args.workers,
+            qps=args.qps,
+            quota_budget=args.quota_budget,
+            near_dup_index=args.near_dup_index,
+            near_dup_threshold=args.near_dup_threshold,
+            batch=date,
+            client=FakeYouTube() if args.fake else None,
         )
     else:
         path = collect_trends(region=args.region, top_n=args.top_n, out_csv=args.out)
 
     print(f"✅ Saved live dataset: {path}")
+    if args.store:
+        LiveStore(args.store).append(pd.read_csv(path, dtype=str, keep_default_na=False), date, replace=True)
+        print(f"✅ Appended to store: {args.store}")
 
 if __name__ == "__main__":
     main()
@@ -1,66 +1,159 @@
 # collectors/youtube_collector.py
-import os, time, csv
+import os, csv, threading
 from datetime import datetime
-from googleapiclient.discovery import build
-from collectors.templates import categorize, expected_behavior_for_category, build_prompt_from_comment
+from concurrent.futures import ThreadPoolExecutor
+from collectors.collectors.templates import categorize, expected_behavior_for_category, build_prompt_from_comment
+from collectors.fetch_pool import TokenBucket
+from collectors.near_dup import NearDupIndex
+
+# YouTube Data API v3 quota cost per call (units); default daily quota is 10,000.
+QUOTA_COST = {"search": 100, "videos": 1, "commentThreads": 1}
+MAX_PAGE = 50   # maxResults cap of search.list and videos.list
+
+class QuotaExceeded(RuntimeError):
+    pass
+
+class QuotaTracker:
+    def __init__(self, budget=10000):
+        self.budget = budget
+        self.used = 0
+        self.by_kind = {}
+        self.exhausted = False
+        self._lock = threading.Lock()
+
+    def charge(self, kind):
+        cost = QUOTA_COST[kind]
+        with self._lock:
+            if self.used + cost > self.budget:
+                self.exhausted = True
+                raise QuotaExceeded(f"quota budget {self.budget} reached ({self.used} used)")
+            self.used += cost
+            self.by_kind[kind] = self.by_kind.get(kind, 0) + cost
+
+_client = None
+_client_lock = threading.Lock()
+_tls = threading.local()
 
 def _yt_client():
-    api_key = os.getenv("YOUTUBE_API_KEY")
-    if not api_key:
-        raise RuntimeError("YOUTUBE_API_KEY env var not set")
-    return build("youtube", "v3", developerKey=api_key, cache_discovery=False)
-
-def search_video_ids(query: str, max_results=5):
-    yt = _yt_client()
-    res = yt.search().list(
-        part="id", q=query, type="video", maxResults=max_results, relevanceLanguage="en"
-    ).execute()
-    ids = [item["id"]["videoId"] for item in res.get("items", [])]
-    return ids
-
-def trending_video_ids(region_code="IN", max_results=5):
-    yt = _yt_client()
-    res = yt.videos().list(
+    # Built once per process; discovery is slow and the service object is
+    # only used to build requests (execution uses a per-thread transport).
+    global _client
+    with _client_lock:
+        if _client is None:
+            api_key = os.getenv("YOUTUBE_API_KEY")
+            if not api_key:
+                raise RuntimeError("YOUTUBE_API_KEY env var not set")
+            from googleapiclient.discovery import build
+            _client = build("youtube", "v3", developerKey=api_key, cache_discovery=False)
+        return _client
+
+def _thread_http():
+    # httplib2.Http is not thread-safe, so each worker thread gets its own.
+    if not hasattr(_tls, "http"):
+        import httplib2
+        _tls.http = httplib2.Http(timeout=30)
+    return _tls.http
+
+def _execute(request, kind, quota=None, limiter=None):
+    if limiter is not None:
+        limiter.acquire()
+    if quota is not None:
+        quota.charge(kind)
+    if hasattr(request, "http"):  # googleapiclient HttpRequest
+        return request.execute(http=_thread_http())
+    return request.execute()
+
+def _paged_ids(list_page, kind, extract, max_results, quota=None, limiter=None):
+    # search.list / videos.list return at most MAX_PAGE items per call; follow
+    # nextPageToken (charging quota per page) until max_results ids are in.
+    ids, page_token = [], None
+    while len(ids) < max_results:
+        try:
+            res = _execute(list_page(min(MAX_PAGE, max_results - len(ids)), page_token), kind, quota, limiter)
+        except QuotaExceeded:
+            if not ids:
+                raise
+            break  # keep the pages we already paid for
+        ids.extend(extract(item) for item in res.get("items", []))
+        page_token = res.get("nextPageToken")
+        if not page_token:
+            break
+    return ids[:max_results]
+
+def search_video_ids(query: str, max_results=5, client=None, quota=None, limiter=None):
+    yt = client or _yt_client()
+    return _paged_ids(lambda n, token: yt.search().list(
+        part="id", q=query, type="video", maxResults=n, relevanceLanguage="en", pageToken=token
+    ), "search", lambda item: item["id"]["videoId"], max_results, quota, limiter)
+
+def trending_video_ids(region_code="IN", max_results=5, client=None, quota=None, limiter=None):
+    yt = client or _yt_client()
+    return _paged_ids(lambda n, token: yt.videos().list(
         part="id",
         chart="mostPopular",
         regionCode=region_code,
-        maxResults=max_results
-    ).execute()
-    return [item["id"] for item in res.get("items", [])]
+        maxResults=n,
+        pageToken=token
+    ), "videos", lambda item: item["id"], max_results, quota, limiter)
 
-def fetch_comments(video_id: str, max_total=50):
-    yt = _yt_client()
+def fetch_comments(video_id: str, max_total=50, client=None, quota=None, limiter=None):
+    yt = client or _yt_client()
     comments = []
     page_token = None
     while len(comments) < max_total:
-        res = yt.commentThreads().list(
-            part="snippet",
-            videoId=video_id,
-            textFormat="plainText",
-            maxResults=min(100, max_total - len(comments)),
-            pageToken=page_token
-        ).execute()
+        try:
+            res = _execute(yt.commentThreads().list(
+                part="snippet",
+                videoId=video_id,
+                textFormat="plainText",
+                maxResults=min(100, max_total - len(comments)),
+                pageToken=page_token
+            ), "commentThreads", quota, limiter)
+        except QuotaExceeded:
+            break  # keep what we have; the caller stops scheduling more videos
         for item in res.get("items", []):
             top = item["snippet"]["topLevelComment"]["snippet"]
             comments.append(top.get("textDisplay",""))
         page_token = res.get("nextPageToken")
         if not page_token:
             break
-        time.sleep(0.3)  # be polite
     return comments
 
-def collect_youtube(query=None, region="IN", per_video_comments=30, max_videos=5, out_csv=None):
+def collect_youtube(query=None, region="IN", per_video_comments=30, max_videos=5, out_csv=None,
+                    workers=8, qps=5.0, quota_budget=10000, client=None,
+                    near_dup_index=None, near_dup_threshold=0.8, batch=None):
+    # batch: near-dup index key, the YYYYMMDD date as in build_multi_live.py
+    batch = batch or datetime.utcnow().strftime("%Y%m%d")
     if not out_csv:
-        out_csv = f"data/live_prompts_{datetime.utcnow().strftime('%Y%m%d')}.csv"
+        out_csv = f"data/live_prompts_{batch}.csv"
+
+    client = client or _yt_client()
+    quota = QuotaTracker(quota_budget)
+    limiter = TokenBucket(qps)  # paces every API call, shared by all workers
+    try:
+        if query:
+            vids = search_video_ids(query, max_results=max_videos, client=client, quota=quota, limiter=limiter)
+        else:
+            vids = trending_video_ids(region_code=region, max_results=max_videos, client=client, quota=quota, limiter=limiter)
+    except QuotaExceeded as e:
+        print(f"[WARN] {e}; no videos fetched")
+        vids = []
 
-    if query:
-        vids = search_video_ids(query, max_results=max_videos)
-    else:
-        vids = trending_video_ids(region_code=region, max_results=max_videos)
+    def comments_for(vid):
+        if quota.exhausted:
+            return []
+        try:
+            return fetch_comments(vid, max_total=per_video_comments, client=client, quota=quota, limiter=limiter)
+        except Exception as e:  # e.g. comments disabled on this video
+            print(f"[WARN] comments unavailable for {vid}: {e}")
+            return []
+
+    with ThreadPoolExecutor(max(1, workers)) as ex:
+        per_video = list(ex.map(comments_for, vids))
 
     rows = []
-    for vid in vids:
-        for c in fetch_comments(vid, max_total=per_video_comments):
+    for vid, comments in zip(vids, per_video):
+        for c in comments:
             cat = categorize(c)
             expected = expected_behavior_for_category(cat)
             prompt = build_prompt_from_comment(c)
@@ -71,6 +164,8 @@ def collect_youtube(query=None, region="IN", per_video_comments=30, max_videos=5
                 "source": "youtube",
                 "url": f"https://www.youtube.com/watch?v={vid}",
             })
+    print(f"YouTube quota used: {quota.used}/{quota.budget} {quota.by_kind}"
+          + (" (budget reached, stopped early)" if quota.exhausted else ""))
 
     # dedupe short/empty
     clean = []
@@ -82,6 +177,13 @@ def collect_youtube(query=None, region="IN", per_video_comments=30, max_videos=5
         seen.add(p)
         clean.append(r)
 
+    if near_dup_index:
+        idx = NearDupIndex(near_dup_index, threshold=near_dup_threshold)
+        before = len(clean)
+        clean = idx.filter_new(clean, batch=batch)
+        print(f"Near-duplicates dropped: {before - len(clean)} (index size {len(idx)})")
+        idx.close()
+
     os.makedirs(os.path.dirname(out_csv), exist_ok=True)
     with open(out_csv, "w", newline="", encoding="utf-8") as f:
         w = csv.DictWriter(f, fieldnames=["prompt","category","expected_behavior","source","url"])
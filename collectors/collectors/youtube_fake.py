@@ -0,0 +1,88 @@
+# collectors/youtube_fake.py
+# Offline stand-in for the YouTube Data API v3 discovery client.
+#
+# Mimics the small slice of the client that youtube_collector uses
+# (search().list, videos().list, commentThreads().list, each returning a
+# request with .execute()), with deterministic, paginated videos and
+# comments. maxResults above the real API's caps (50 videos, 100 comment
+# threads per page) is rejected like the real API does. Pass an instance as
+# collect_youtube(client=...), or run run_live.py with --fake.
+
+import threading
+
+MAX_RESULTS = {"search": 50, "videos": 50, "commentThreads": 100}
+
+class _Request:
+    def __init__(self, fn, kwargs):
+        self._fn = fn
+        self._kwargs = kwargs
+
+    def execute(self, http=None, num_retries=0):
+        return self._fn(**self._kwargs)
+
+class _Resource:
+    def __init__(self, fn):
+        self._fn = fn
+
+    def list(self, **kwargs):
+        return _Request(self._fn, kwargs)
+
+class FakeYouTube:
+    def __init__(self, n_videos=500, comments_per_video=250, page_size=100, disabled=()):
+        self.n_videos = n_videos
+        self.comments_per_video = comments_per_video
+        self.page_size = page_size
+        self.disabled = set(disabled)  # video ids that answer like "comments disabled"
+        self.calls = {"search": 0, "videos": 0, "commentThreads": 0}
+        self._lock = threading.Lock()
+
+    def _count(self, kind, max_results):
+        with self._lock:
+            self.calls[kind] += 1
+        if not 0 <= max_results <= MAX_RESULTS[kind]:
+            raise ValueError(f"invalidValue: maxResults={max_results} (allowed 0-{MAX_RESULTS[kind]})")
+
+    def _videos(self, max_results, page_token, prefix):
+        start = int(page_token or 0)
+        stop = min(self.n_videos, start + max_results)
+        page = {"ids": [f"{prefix}{i:04d}" for i in range(start, stop)]}
+        if stop < self.n_videos:
+            page["nextPageToken"] = str(stop)
+        return page
+
+    @staticmethod
+    def _page(items, page):
+        res = {"items": items}
+        if "nextPageToken" in page:
+            res["nextPageToken"] = page["nextPageToken"]
+        return res
+
+    def search(self):
+        def run(q, maxResults=5, pageToken=None, **_):
+            self._count("search", maxResults)
+            page = self._videos(maxResults, pageToken, "s")
+            return self._page([{"id": {"videoId": v}} for v in page["ids"]], page)
+        return _Resource(run)
+
+    def videos(self):
+        def run(maxResults=5, regionCode="IN", pageToken=None, **_):
+            self._count("videos", maxResults)
+            page = self._videos(maxResults, pageToken, f"t{regionCode}")
+            return self._page([{"id": v} for v in page["ids"]], page)
+        return _Resource(run)
+
+    def commentThreads(self):
+        def run(videoId, maxResults=20, pageToken=None, **_):
+            self._count("commentThreads", maxResults)
+            if videoId in self.disabled:
+                raise RuntimeError(f"commentsDisabled: {videoId}")
+            start = int(pageToken or 0)
+            stop = min(self.comments_per_video, start + min(maxResults, self.page_size))
+            items = [{"snippet": {"topLevelComment": {"snippet": {
+                "textDisplay": f"Comment {k} on video {videoId}: what do you all think about this one?"}}}}
+                for k in range(start, stop)]
+            res = {"items": items}
+            if stop < self.comments_per_video:
+                res["nextPageToken"] = str(stop)
+            return res
+        return _Resource(run)
@@ -0,0 +1,153 @@
+# collectors/fetch_pool.py
+# Concurrent, connection-pooled HTTP fetching for the live collectors.
+#
+# One requests.Session (keep-alive, pooled per host) is shared by every
+# source. Sources run side by side in their own threads; per-item fan-out
+# (e.g. one request per Hacker News story) goes through a separate bounded
+# pool so it can't starve the sources. Each host gets a token-bucket rate
+# limit, transient failures (RETRY_STATUS responses, connection errors and
+# timeouts) are retried with exponential backoff, and
+# per-source latency / failure counts are kept for the run report.
+
+import time, random, threading
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+def _retryable(exc):
+    # transient failures only: throttling / server errors and network trouble.
+    # Other 4xx (404, 403, ...) and undecodable bodies won't fix themselves.
+    if isinstance(exc, requests.HTTPError):
+        return exc.response is not None and exc.response.status_code in RETRY_STATUS
+    return isinstance(exc, (requests.ConnectionError, requests.Timeout))
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` tokens/s, bursts of up to `capacity`."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self.tokens = self.capacity
+        self.stamp = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, n=1.0):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate)
+                self.stamp = now
+                if self.tokens >= n:
+                    self.tokens -= n
+                    return
+                wait = (n - self.tokens) / self.rate
+            time.sleep(wait)
+
+class SourceStats:
+    def __init__(self):
+        self.requests = 0
+        self.failures = 0
+        self.retries = 0
+        self.request_time = 0.0
+        self.wall_time = None
+        self.rows = None
+        self.error = None
+
+    def as_dict(self):
+        avg = self.request_time / self.requests if self.requests else None
+        return {
+            "rows": self.rows, "requests": self.requests, "failures": self.failures,
+            "retries": self.retries, "avg_latency_s": None if avg is None else round(avg, 3),
+            "wall_s": None if self.wall_time is None else round(self.wall_time, 3), "error": self.error,
+        }
+
+class Fetcher:
+    def __init__(self, max_concurrency=16, host_rates=None, default_rate=20.0, retries=3,
+                 backoff=0.5, timeout=30, pool_size=32):
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.host_rates = dict(host_rates or {})
+        self.default_rate = default_rate
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self._fanout = ThreadPoolExecutor(max_concurrency, thread_name_prefix="fetch")
+        self.stats = {}
+
+    def _bucket(self, url):
+        host = urlparse(url).netloc
+        with self._lock:
+            if host not in self._buckets:
+                self._buckets[host] = TokenBucket(self.host_rates.get(host, self.default_rate))
+            return self._buckets[host]
+
+    def _stats(self, source):
+        with self._lock:
+            return self.stats.setdefault(source or "default", SourceStats())
+
+    def get_json(self, url, params=None, source=None):
+        """GET + JSON decode with rate limiting and retry/backoff. Raises on final failure,
+        or at once for errors that retrying can't fix."""
+        st = self._stats(source)
+        bucket = self._bucket(url)
+        for attempt in range(self.retries + 1):
+            bucket.acquire()
+            t0 = time.perf_counter()
+            try:
+                r = self.session.get(url, params=params, timeout=self.timeout)
+                r.raise_for_status()
+                return r.json()
+            except (requests.RequestException, ValueError) as e:
+                with self._lock:
+                    st.failures += 1
+                if attempt == self.retries or not _retryable(e):
+                    raise
+                with self._lock:
+                    st.retries += 1
+                time.sleep(self.backoff * (2 ** attempt) * (1 + random.random() * 0.25))
+            finally:
+                with self._lock:
+                    st.requests += 1
+                    st.request_time += time.perf_counter() - t0
+
+    def map_json(self, urls, source=None):
+        """Fetch many URLs through the bounded fan-out pool; failed items come back as None."""
+        def one(url):
+            try:
+                return self.get_json(url, source=source)
+            except Exception:
+                return None
+        return list(self._fanout.map(one, urls))
+
+    def run_sources(self, sources):
+        """Run {name: fn(fetcher) -> rows} concurrently; a failing source yields []."""
+        def run(name, fn):
+            st = self._stats(name)
+            t0 = time.perf_counter()
+            try:
+                rows = fn(self)
+            except Exception as e:
+                st.error = f"{type(e).__name__}: {e}"
+                rows = []
+            st.wall_time = time.perf_counter() - t0
+            st.rows = len(rows)
+            return rows
+
+        with ThreadPoolExecutor(max(1, len(sources)), thread_name_prefix="source") as ex:
+            futures = {name: ex.submit(run, name, fn) for name, fn in sources.items()}
+            return {name: f.result() for name, f in futures.items()}
+
+    def report(self):
+        return {name: st.as_dict() for name, st in self.stats.items()}
+
+    def close(self):
+        self._fanout.shutdown(wait=True)
+        self.session.close()
@@ -0,0 +1,145 @@
+# collectors/live_store.py
+# Date/source-partitioned store for live prompts, with a manifest index.
+#
+#   data/live_store/
+#     manifest.json                      <- one entry per partition
+#     20251023/gdelt.csv                 <- rows for one (date, source)
+#     20251023/hackernews.csv
+#
+# Each manifest entry records the partition's date, source, path, row count
+# and per-category counts, so date-range / source / category queries decide
+# which files to open from the manifest alone and only parse those.
+#
+#   python -m collectors.live_store import data/live/live_prompts_*.csv
+#   python -m collectors.live_store query --start 20251001 --end 20251007 --source gdelt
+
+import os, re, json, glob, argparse
+import pandas as pd
+
+DEFAULT_ROOT = os.path.join("data", "live_store")
+COLUMNS = ["prompt", "category", "expected_behavior", "source", "url"]
+
+def _safe(name):
+    return re.sub(r"[^A-Za-z0-9_.-]+", "_", str(name) or "unknown")
+
+class LiveStore:
+    def __init__(self, root=DEFAULT_ROOT):
+        self.root = root
+        self.manifest_path = os.path.join(root, "manifest.json")
+        self.entries = []
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, encoding="utf-8") as f:
+                self.entries = json.load(f).get("partitions", [])
+
+    def _save_manifest(self):
+        os.makedirs(self.root, exist_ok=True)
+        self.entries.sort(key=lambda e: (e["date"], e["source"]))
+        tmp = self.manifest_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"partitions": self.entries}, f, indent=1)
+        os.replace(tmp, self.manifest_path)
+
+    def append(self, rows, date, replace=False):
+        """Add one day's rows. replace=True first drops that day's partitions
+        for the sources present in `rows` (so re-running a collector for the
+        same day is idempotent without touching other collectors' sources)."""
+        date = str(date)
+        df = pd.DataFrame(rows, columns=COLUMNS) if not isinstance(rows, pd.DataFrame) else rows
+        if replace:
+            sources = set(df["source"].fillna("unknown"))
+            for e in [e for e in self.entries if e["date"] == date and e["source"] in sources]:
+                path = os.path.join(self.root, e["path"])
+                if os.path.exists(path):
+                    os.remove(path)
+                self.entries.remove(e)
+        by_key = {(e["date"], e["source"]): e for e in self.entries}
+        for source, part in df.groupby(df["source"].fillna("unknown"), sort=True):
+            rel = os.path.join(date, _safe(source) + ".csv")
+            path = os.path.join(self.root, rel)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            exists = os.path.exists(path)
+            part.to_csv(path, mode="a" if exists else "w", header=not exists, index=False)
+            cats = part["category"].fillna("unknown").value_counts().to_dict()
+            e = by_key.get((date, source))
+            if e is None:
+                e = {"date": date, "source": source, "path": rel, "rows": 0, "categories": {}}
+                self.entries.append(e)
+                by_key[(date, source)] = e
+            e["rows"] += int(len(part))
+            for c, n in cats.items():
+                e["categories"][c] = e["categories"].get(c, 0) + int(n)
+        self._save_manifest()
+
+    def partitions(self, start=None, end=None, sources=None, categories=None):
+        """Manifest entries that can contain matching rows (no file I/O)."""
+        out = []
+        for e in self.entries:
+            if start and e["date"] < str(start):
+                continue
+            if end and e["date"] > str(end):
+                continue
+            if sources and e["source"] not in sources:
+                continue
+            if categories and not any(c in e["categories"] for c in categories):
+                continue
+            out.append(e)
+        return out
+
+    def query(self, start=None, end=None, sources=None, categories=None, columns=None):
+        """Rows in [start, end] (YYYYMMDD, inclusive) filtered by source/category.
+        Adds a `date` column. Only the partitions selected by the manifest are read."""
+        frames = []
+        cols = None if columns is None else list(dict.fromkeys(list(columns) + ["category"]))
+        for e in self.partitions(start, end, sources, categories):
+            df = pd.read_csv(os.path.join(self.root, e["path"]), usecols=cols, dtype=str, keep_default_na=False)
+            if categories:
+                df = df[df["category"].isin(categories)]
+            df.insert(0, "date", e["date"])
+            frames.append(df)
+        if not frames:
+            return pd.DataFrame(columns=["date"] + (list(columns) if columns else COLUMNS))
+        df = pd.concat(frames, ignore_index=True)
+        return df if columns is None else df[["date"] + list(columns)]
+
+    def dates(self):
+        return sorted({e["date"] for e in self.entries})
+
+def import_daily_csvs(store, paths):
+    """Backfill from data/live/live_prompts_YYYYMMDD.csv files."""
+    for path in sorted(paths):
+        m = re.search(r"(\d{8})", os.path.basename(path))
+        if not m:
+            continue
+        df = pd.read_csv(path, dtype=str, keep_default_na=False)
+        store.append(df.reindex(columns=COLUMNS, fill_value=""), m.group(1), replace=True)
+        print(f"{path}: {len(df)} rows -> {m.group(1)}")
+
+def main():
+    p = argparse.ArgumentParser(description="Partitioned live prompt store")
+    sub = p.add_subparsers(dest="cmd", required=True)
+    imp = sub.add_parser("import")
+    imp.add_argument("files", nargs="+")
+    q = sub.add_parser("query")
+    q.add_argument("--start")
+    q.add_argument("--end")
+    q.add_argument("--source", action="append")
+    q.add_argument("--category", action="append")
+    q.add_argument("--out", default=None, help="write CSV here instead of printing a summary")
+    p.add_argument("--root", default=DEFAULT_ROOT)
+    args = p.parse_args()
+
+    store = LiveStore(args.root)
+    if args.cmd == "import":
+        import_daily_csvs(store, [x for pat in args.files for x in glob.glob(pat)])
+        print(f"{len(store.entries)} partitions over {len(store.dates())} days")
+    else:
+        parts = store.partitions(args.start, args.end, args.source, args.category)
+        df = store.query(args.start, args.end, args.source, args.category)
+        print(f"read {len(parts)}/{len(store.entries)} partitions, {len(df)} rows")
+        if args.out:
+            df.to_csv(args.out, index=False)
+        else:
+            print(df.groupby(["date", "source"]).size().to_string() if len(df) else "(no rows)")
+
+if __name__ == "__main__":
+    main()
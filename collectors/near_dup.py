@@ -0,0 +1,177 @@
+# collectors/near_dup.py
+# Persistent MinHash / LSH near-duplicate index over the live prompt history.
+#
+# Each text (the user comment / headline / trend term inside a prompt, not
+# the shared template) is reduced to character 5-gram shingles and a
+# MinHash signature. Signatures are split into LSH bands; two texts collide
+# in some band with high probability iff their Jaccard similarity is above
+# the threshold, and collisions are then checked against the estimated
+# similarity. Bands live in an indexed SQLite table, so a lookup touches a
+# handful of rows no matter how large the archive gets, and each day's
+# collection only appends.
+#
+#   python -m collectors.near_dup build data/live/live_prompts_*.csv   # backfill
+#   python -m collectors.near_dup stats
+
+import os, re, sys, glob, sqlite3, hashlib, argparse
+import numpy as np
+
+DEFAULT_PATH = os.path.join("data", "live", "near_dup.sqlite")
+_MERSENNE = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+
+_CORE_PATTERNS = [
+    re.compile(r"User:\s*(.*?)\s*Assistant:\s*$", re.S),
+    re.compile(r"^Explain what '(.*)' is and", re.S),
+]
+
+def prompt_core(prompt):
+    """Strip the known prompt templates and return the varying text."""
+    for pat in _CORE_PATTERNS:
+        m = pat.search(prompt or "")
+        if m:
+            return m.group(1)
+    return prompt or ""
+
+def shingles(text, k=5):
+    t = re.sub(r"\s+", " ", (text or "").lower()).strip()
+    if len(t) <= k:
+        return {t}
+    return {t[i:i + k] for i in range(len(t) - k + 1)}
+
+def optimal_bands(threshold, num_perm):
+    """Pick (bands, rows) so the LSH S-curve threshold (1/b)^(1/r) is closest to `threshold`."""
+    best = None
+    for r in range(1, num_perm + 1):
+        if num_perm % r:
+            continue
+        b = num_perm // r
+        err = abs((1.0 / b) ** (1.0 / r) - threshold)
+        if best is None or err < best[0]:
+            best = (err, b, r)
+    return best[1], best[2]
+
+class NearDupIndex:
+    def __init__(self, path=DEFAULT_PATH, threshold=0.8, num_perm=128, seed=1):
+        self.path = path
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands, self.rows = optimal_bands(threshold, num_perm)
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, np.iinfo(np.int64).max, size=num_perm, dtype=np.int64).astype(np.uint64) % _MERSENNE
+        self._b = rng.randint(0, np.iinfo(np.int64).max, size=num_perm, dtype=np.int64).astype(np.uint64) % _MERSENNE
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path)
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS meta (k TEXT PRIMARY KEY, v TEXT);
+            CREATE TABLE IF NOT EXISTS items (id INTEGER PRIMARY KEY, batch TEXT, text TEXT, sig BLOB);
+            CREATE TABLE IF NOT EXISTS bands (band INTEGER, bucket INTEGER, id INTEGER);
+            CREATE INDEX IF NOT EXISTS bands_lookup ON bands(band, bucket);
+            CREATE INDEX IF NOT EXISTS items_batch ON items(batch);
+        """)
+        self._check_meta(seed)
+
+    def _check_meta(self, seed):
+        meta = dict(self._db.execute("SELECT k, v FROM meta"))
+        sig_params = f"{self.num_perm}:{seed}"
+        if meta.get("sig_params", sig_params) != sig_params:
+            raise ValueError(f"{self.path} was built with num_perm:seed={meta['sig_params']}, not {sig_params}")
+        banding = f"{self.bands}x{self.rows}"
+        if meta.get("banding") not in (None, banding):
+            self._rebuild_bands()  # threshold changed: signatures are still valid
+        self._db.executemany("INSERT OR REPLACE INTO meta VALUES (?, ?)",
+                             [("sig_params", sig_params), ("banding", banding)])
+        self._db.commit()
+
+    def signature(self, text):
+        hv = np.fromiter((int.from_bytes(hashlib.sha1(s.encode("utf-8")).digest()[:4], "little")
+                          for s in shingles(text)), dtype=np.uint64)
+        phv = ((np.outer(hv, self._a) + self._b) % _MERSENNE) & _MAX_HASH
+        return phv.min(axis=0).astype(np.uint32)
+
+    def _buckets(self, sig):
+        out = []
+        for band in range(self.bands):
+            chunk = sig[band * self.rows:(band + 1) * self.rows].tobytes()
+            out.append((band, int.from_bytes(hashlib.blake2b(chunk, digest_size=7).digest(), "little")))
+        return out
+
+    def _rebuild_bands(self):
+        self._db.execute("DELETE FROM bands")
+        for item_id, blob in self._db.execute("SELECT id, sig FROM items").fetchall():
+            sig = np.frombuffer(blob, dtype=np.uint32)
+            self._db.executemany("INSERT INTO bands VALUES (?, ?, ?)",
+                                 [(b, k, item_id) for b, k in self._buckets(sig)])
+
+    def query(self, text, sig=None):
+        """Ids of indexed texts whose estimated Jaccard similarity >= threshold."""
+        sig = self.signature(text) if sig is None else sig
+        cand = set()
+        for band, bucket in self._buckets(sig):
+            cand.update(r[0] for r in self._db.execute(
+                "SELECT id FROM bands WHERE band=? AND bucket=?", (band, bucket)))
+        hits = []
+        for item_id in cand:
+            other = np.frombuffer(self._db.execute("SELECT sig FROM items WHERE id=?", (item_id,)).fetchone()[0],
+                                  dtype=np.uint32)
+            if np.mean(other == sig) >= self.threshold:
+                hits.append(item_id)
+        return hits
+
+    def add(self, text, batch=None, sig=None):
+        sig = self.signature(text) if sig is None else sig
+        cur = self._db.execute("INSERT INTO items (batch, text, sig) VALUES (?, ?, ?)", (batch, text, sig.tobytes()))
+        self._db.executemany("INSERT INTO bands VALUES (?, ?, ?)",
+                             [(b, k, cur.lastrowid) for b, k in self._buckets(sig)])
+        return cur.lastrowid
+
+    def drop_batch(self, batch):
+        ids = [r[0] for r in self._db.execute("SELECT id FROM items WHERE batch=?", (batch,))]
+        self._db.executemany("DELETE FROM bands WHERE id=?", [(i,) for i in ids])
+        self._db.execute("DELETE FROM items WHERE batch=?", (batch,))
+
+    def filter_new(self, rows, batch, text_of=lambda r: prompt_core(r["prompt"])):
+        """Keep rows that are not near-duplicates of the history (or of earlier rows),
+        and add the kept ones to the index under `batch`. Re-running the same batch
+        replaces its earlier entries instead of matching against them."""
+        self.drop_batch(batch)
+        kept = []
+        for r in rows:
+            text = text_of(r)
+            sig = self.signature(text)
+            if self.query(text, sig):
+                continue
+            self.add(text, batch, sig)
+            kept.append(r)
+        self._db.commit()
+        return kept
+
+    def __len__(self):
+        return self._db.execute("SELECT COUNT(*) FROM items").fetchone()[0]
+
+    def close(self):
+        self._db.commit()
+        self._db.close()
+
+def main():
+    p = argparse.ArgumentParser(description="Near-duplicate index over live prompt files")
+    p.add_argument("cmd", choices=["build", "stats"])
+    p.add_argument("files", nargs="*")
+    p.add_argument("--index", default=os.getenv("NEAR_DUP_INDEX", DEFAULT_PATH))
+    p.add_argument("--threshold", type=float, default=float(os.getenv("NEAR_DUP_THRESHOLD", "0.8")))
+    args = p.parse_args()
+    import pandas as pd
+
+    idx = NearDupIndex(args.index, threshold=args.threshold)
+    if args.cmd == "build":
+        for f in sorted(x for pat in args.files for x in glob.glob(pat)):
+            batch = re.sub(r"\D", "", os.path.basename(f)) or os.path.basename(f)
+            rows = pd.read_csv(f).to_dict("records")
+            kept = idx.filter_new(rows, batch)
+            print(f"{f}: {len(kept)}/{len(rows)} new")
+    print(f"{args.index}: {len(idx)} items, {idx.bands} bands x {idx.rows} rows (threshold {idx.threshold})")
+    idx.close()
+
+if __name__ == "__main__":
+    sys.exit(main())
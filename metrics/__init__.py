@@ -0,0 +1,2 @@
+# package marker
+__all__ = []
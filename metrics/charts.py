@@ -0,0 +1,145 @@
+# metrics/charts.py
+# Dependency-tracked chart rendering.
+#
+# A chart is (output png, drawing function, input data, params). Its key is
+# a hash of the function name, the data and the params; keys of the charts
+# last written are kept in results/charts_manifest.json (committed next to
+# the PNGs). render() skips every chart whose key is unchanged and whose PNG
+# still exists, and draws the rest in worker processes on the Agg backend.
+# matplotlib is only imported by a process that actually draws something.
+#
+# Drawing functions live here (module level) so workers can import them;
+# each takes the pyplot module, the data and keyword params.
+
+import os, json, hashlib
+from concurrent.futures import ProcessPoolExecutor
+
+CHARTS_VERSION = "1"  # bump when a drawing function's output changes
+MANIFEST_PATH = os.path.join("results", "charts_manifest.json")
+
+def _jsonable(o):
+    if hasattr(o, "tolist"):
+        return o.tolist()
+    raise TypeError(f"not JSON serializable: {type(o).__name__}")
+
+def chart_key(fn_name, data, params):
+    blob = json.dumps([CHARTS_VERSION, fn_name, data, params], sort_keys=True, default=_jsonable)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+def _pyplot():
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    return plt
+
+def _draw(job):
+    out_png, fn_name, data, params = job
+    plt = _pyplot()
+    globals()[fn_name](plt, data, **params)
+    os.makedirs(os.path.dirname(os.path.abspath(out_png)), exist_ok=True)
+    plt.tight_layout()
+    plt.savefig(out_png)
+    plt.close("all")
+    return out_png
+
+def _load_manifest(path):
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    return {}
+
+def render(jobs, manifest_path=MANIFEST_PATH, workers=None, force=False):
+    """Draw the charts in `jobs` ([(out_png, fn_name, data, params)]) whose
+    inputs changed. Returns (rendered, skipped) lists of output paths."""
+    manifest = _load_manifest(manifest_path)
+    todo, skipped, keys = [], [], {}
+    for out_png, fn_name, data, params in jobs:
+        key = chart_key(fn_name, data, params)
+        keys[out_png] = key
+        if not force and manifest.get(out_png) == key and os.path.exists(out_png):
+            skipped.append(out_png)
+        else:
+            todo.append((out_png, fn_name, data, params))
+
+    rendered = []
+    if len(todo) == 1 or workers == 1:
+        rendered = [_draw(j) for j in todo]
+    elif todo:
+        workers = workers or min(len(todo), os.cpu_count() or 1)
+        with ProcessPoolExecutor(workers) as ex:
+            rendered = list(ex.map(_draw, todo))
+
+    if rendered:
+        manifest = _load_manifest(manifest_path)  # another script may have written it meanwhile
+        manifest.update({p: keys[p] for p in rendered})
+        os.makedirs(os.path.dirname(os.path.abspath(manifest_path)), exist_ok=True)
+        tmp = manifest_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(dict(sorted(manifest.items())), f, indent=1)
+        os.replace(tmp, manifest_path)
+    print(f"Charts: {len(rendered)} rendered, {len(skipped)} unchanged")
+    return rendered, skipped
+
+def series_by_model(models, dates, values):
+    """{model: [[date, value], ...]} from per-model date lists and a [models, days] array
+    (left-aligned, as metrics.engine.stack_history returns); NaN becomes None."""
+    out = {}
+    for i, m in enumerate(models):
+        vals = [float(v) for v in values[i][:len(dates[i])]]
+        out[m] = [[d, None if v != v else round(v, 6)] for d, v in zip(dates[i], vals)]
+    return out
+
+def drift_job(models, dates, drift, window, out_png=os.path.join("results", "drift_index.png")):
+    """The drift index chart; shared by compute_metrics.py and drift_index.py so
+    whichever runs second finds it up to date."""
+    series = series_by_model(models, dates, drift)
+    if not any(v is not None for pts in series.values() for _, v in pts):
+        return (out_png, "no_data", None, {"title": "Drift Index", "message": "Not enough history for drift yet",
+                                           "figsize": (8, 4), "fontsize": 14})
+    return (out_png, "lines_by_model", series,
+            {"title": f"Drift Index (Jensen–Shannon Divergence vs {window}-day average)",
+             "ylabel": "JSD (0–1)", "ylim": (0, 1), "figsize": (8, 4), "grid": True})
+
+# ---- drawing functions ----------------------------------------------------
+
+def no_data(plt, data, title, message="No Data", figsize=(6, 3), fontsize=16):
+    plt.figure(figsize=figsize)
+    plt.text(0.5, 0.5, message, ha='center', va='center', fontsize=fontsize)
+    plt.title(title)
+
+def bar_counts(plt, counts, title):
+    """Per-model summary: one bar per class, in the order given."""
+    plt.figure()
+    plt.bar([str(k) for k in counts], list(counts.values()), width=0.5)
+    plt.xticks(rotation=90)
+    plt.title(title)
+    plt.xlabel("class"); plt.ylabel("count")
+
+def lines_by_model(plt, series, title, ylabel, ylim=None, figsize=(6, 3), grid=False):
+    """series = {model: [[date, value], ...]} with ISO dates; None values are gaps."""
+    from datetime import datetime
+    plt.figure(figsize=figsize)
+    for m, pts in series.items():
+        x = [datetime.strptime(d, "%Y-%m-%d") for d, _ in pts]
+        y = [float("nan") if v is None else v for _, v in pts]
+        plt.plot(x, y, marker='o', label=m)
+    plt.legend(fontsize=7)
+    plt.title(title)
+    plt.xlabel("Date")
+    plt.ylabel(ylabel)
+    if ylim:
+        plt.ylim(*ylim)
+    if grid:
+        plt.grid(True, alpha=0.3)
+
+def grouped_bars(plt, totals, classes, title):
+    """totals = {model: [count per class]}."""
+    plt.figure(figsize=(6, 3))
+    width = 0.8 / max(1, len(totals))
+    for i, (m, vals) in enumerate(totals.items()):
+        plt.bar([k + i * width for k in range(len(classes))], vals, width, label=m)
+    plt.xticks([k + 0.4 - width / 2 for k in range(len(classes))], classes)
+    plt.legend(fontsize=7)
+    plt.title(title)
+    plt.xlabel("Class")
+    plt.ylabel("Count")
@@ -1,79 +1,90 @@
-import os
-import pandas as pd
+import os, sys, json, hashlib, argparse
+from datetime import datetime
 import numpy as np
-import matplotlib.pyplot as plt
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+from metrics.engine import MetricsEngine, CLASSES, WINDOW, CHART_DAYS, day_from_summary, summary_date, normalize_date
+from metrics.charts import render, series_by_model, drift_job
 
 os.makedirs('results', exist_ok=True)
 
 # Paths
-history_path = 'metrics/history_metrics.csv'
+summary_path = 'results/summary_all.json'
 drift_path = 'results/drift_index.png'
 timeseries_path = 'results/safety_timeseries.png'
 weekly_path = 'results/weekly_report.png'
 monthly_path = 'results/monthly_report.png'
-metrics_json_path = 'results/metrics.json'
 
-# Load/create data
-if os.path.exists(history_path):
-    df = pd.read_csv(history_path)
-else:
-    df = pd.DataFrame(columns=["date", "score", "class"])
+def _date_arg(value):
+    try:
+        return normalize_date(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
 
-# 1. Safety Timeseries Plot
-plt.figure(figsize=(6, 3))
-if not df.empty:
-    plt.plot(pd.to_datetime(df['date']), df['score'], marker='o')
-    plt.title("Daily Safety Score")
-    plt.xlabel("Date")
-    plt.ylabel("Safety Score")
-else:
-    plt.text(0.5, 0.5, "No Data", ha='center', va='center', fontsize=16)
-    plt.title("Daily Safety Score")
-plt.tight_layout()
-plt.savefig(timeseries_path)
-plt.close()
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Update daily safety metrics and charts")
+    p.add_argument("--summary", default=summary_path, help="eval_and_publish output to record as one day")
+    p.add_argument("--date", type=_date_arg, default=None,
+                   help="day to record (YYYY-MM-DD or YYYYMMDD); default: the summary's evaluation date")
+    p.add_argument("--window", type=int, default=WINDOW)
+    p.add_argument("--chart_days", type=int, default=CHART_DAYS, help="days of history kept for the charts")
+    p.add_argument("--rebuild", action="store_true", help="recompute drift for the whole history")
+    p.add_argument("--no_add", action="store_true", help="only redraw charts / metrics.json")
+    p.add_argument("--force_charts", action="store_true", help="redraw charts even if their inputs are unchanged")
+    return p.parse_args(argv)
 
-# 2. Drift Index Plot
-plt.figure(figsize=(6, 3))
-if len(df) >= 7:
-    rolling = df['score'].rolling(7).mean()
-    drift = np.abs(df['score'] - rolling)
-    plt.plot(pd.to_datetime(df['date']), drift, marker='o', color='orange')
-    plt.title("Drift Index (|Current - 7d avg|)")
-    plt.xlabel("Date")
-    plt.ylabel("Drift")
-else:
-    plt.text(0.5, 0.5, "Not enough data for drift", ha='center', va='center', fontsize=14)
-    plt.title("Drift Index")
-plt.tight_layout()
-plt.savefig(drift_path)
-plt.close()
+def chart_jobs(models, dates, counts, drift, window):
+    """(out_png, drawing fn, data, params) for every metrics chart; see metrics/charts.py."""
+    if not models:
+        return [(timeseries_path, "no_data", None, {"title": "Daily Safety Score"}),
+                drift_job(models, dates, np.zeros((0, 0)), window, drift_path),
+                (weekly_path, "no_data", None, {"title": "Weekly Class Distribution"}),
+                (monthly_path, "no_data", None, {"title": "Monthly Class Distribution"})]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        score = counts[..., 0] / counts.sum(axis=-1)
+    jobs = [(timeseries_path, "lines_by_model", series_by_model(models, dates, score),
+             {"title": "Daily Safety Score", "ylabel": "Safety Score"}),
+            drift_job(models, dates, drift, window, drift_path)]
+    for timeframe, days, out_path in (("weekly", 7, weekly_path), ("monthly", 30, monthly_path)):
+        totals = {m: [int(x) for x in counts[i, max(0, len(dates[i]) - days):len(dates[i])].sum(axis=0)]
+                  for i, m in enumerate(models)}
+        jobs.append((out_path, "grouped_bars", totals,
+                     {"classes": CLASSES, "title": f"{timeframe.capitalize()} Class Distribution"}))
+    return jobs
 
-# 3. Weekly & Monthly Plots (placeholder)
-def plot_class_dist(timeframe, out_path):
-    plt.figure(figsize=(6,3))
-    if not df.empty:
-        df['date'] = pd.to_datetime(df['date'])
-        cutoff = df['date'].max() - pd.Timedelta(days=6 if timeframe=="weekly" else 29)
-        recent = df[df['date'] >= cutoff]
-        if not recent.empty:
-            recent['class'].value_counts().plot(kind='bar')
-            plt.title(f"{timeframe.capitalize()} Class Distribution")
-            plt.xlabel("Class")
-            plt.ylabel("Count")
+def main(argv=None):
+    args = parse_args(argv)
+    engine = MetricsEngine(window=args.window, chart_days=args.chart_days)
+    if args.rebuild:
+        engine.rebuild()
+    if not args.no_add and os.path.exists(args.summary):
+        with open(args.summary, "rb") as f:
+            raw = f.read()
+        digest = hashlib.sha256(raw).hexdigest()
+        # a summary is one evaluation: re-reading it (e.g. a run triggered by
+        # something else) must not record it again as a new day
+        if digest == engine.state.get("summary_sha256") and not args.date:
+            print(f"{args.summary} unchanged since it was recorded; no day added")
         else:
-            plt.text(0.5, 0.5, "No Recent Data", ha='center', va='center')
-    else:
-        plt.text(0.5, 0.5, "No Data", ha='center', va='center')
-    plt.tight_layout()
-    plt.savefig(out_path)
-    plt.close()
+            summary = json.loads(raw)
+            date = args.date or summary_date(summary)
+            if date is None:
+                date = datetime.utcnow().strftime("%Y-%m-%d")
+                print(f"[WARN] {args.summary} has no evaluation date; recording it as {date}")
+            rows = engine.add_day(date, day_from_summary(summary))
+            engine.state["summary_sha256"] = digest
+            for r in rows:
+                print(f"{r['date']} {r['model']}: safe={r['score']} jsd={r['jsd']} tox_jsd={r['tox_jsd']}")
+    engine.save()
+    engine.write_metrics_json()
 
-plot_class_dist("weekly", weekly_path)
-plot_class_dist("monthly", monthly_path)
+    # Charts cover the last --chart_days days kept in the rolling state (drift
+    # as recorded by add_day), so this stays constant-time as history grows;
+    # only charts whose inputs changed are redrawn.
+    models, dates, counts, drift = engine.chart_data()
+    render(chart_jobs(models, dates, counts, drift, args.window), force=args.force_charts)
 
-# 4. Metrics JSON (latest row or empty)
-metrics = df.iloc[-1].to_dict() if not df.empty else {}
-import json
-with open(metrics_json_path, "w") as f:
-    json.dump(metrics, f, indent=2)
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,297 @@
+# metrics/engine.py
+# Incremental safety metrics with a Jensen–Shannon drift index.
+#
+# State kept between runs (metrics/state.json) is only the last CHART_DAYS
+# days of class counts and drift per model (at least WINDOW+1), so recording
+# a new day and redrawing the charts costs the same no matter how long the
+# history is. Every recorded day is also appended to
+# metrics/history_metrics.csv (one row per model per day) for backfills and
+# rebuild(). The drift index of a day is the JSD (base 2, in [0, 1])
+# between that day's class distribution and the pooled distribution of the
+# trailing WINDOW days.
+#
+# Only numpy + stdlib, so the lightweight metrics workflow can run it.
+
+import os, csv, json, datetime
+import numpy as np
+
+CLASSES = ["safe", "refusal", "unsafe"]
+TOX_CLASSES = ["non-toxic", "toxic"]
+WINDOW = 7
+CHART_DAYS = 90   # days the charts show; kept in the rolling state
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STATE_PATH = os.path.join(REPO_ROOT, "metrics", "state.json")
+HISTORY_PATH = os.path.join(REPO_ROOT, "metrics", "history_metrics.csv")
+METRICS_JSON = os.path.join(REPO_ROOT, "results", "metrics.json")
+
+HISTORY_FIELDS = ["date", "model", *CLASSES, *TOX_CLASSES, "score", "jsd", "tox_jsd", "baseline_days"]
+
+def normalize_date(d):
+    """ISO YYYY-MM-DD for a date/datetime, 'YYYY-MM-DD' or 'YYYYMMDD'; ValueError otherwise.
+    History, state and charts all key on ISO dates."""
+    if isinstance(d, (datetime.date, datetime.datetime)):
+        return d.strftime("%Y-%m-%d")
+    s = str(d).strip()
+    for fmt in ("%Y-%m-%d", "%Y%m%d"):
+        try:
+            return datetime.datetime.strptime(s, fmt).strftime("%Y-%m-%d")
+        except ValueError:
+            pass
+    raise ValueError(f"unrecognised date {d!r}; expected YYYY-MM-DD or YYYYMMDD")
+
+def jsd(p, q, axis=-1):
+    """Jensen–Shannon divergence (base 2) between count/probability arrays.
+
+    Works on any leading shape, e.g. [models, days, classes]; rows are
+    normalized along `axis`. Rows where either side has no mass give NaN.
+    """
+    p = np.asarray(p, dtype=float)
+    q = np.asarray(q, dtype=float)
+    ps = p.sum(axis=axis, keepdims=True)
+    qs = q.sum(axis=axis, keepdims=True)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        p = p / ps
+        q = q / qs
+        m = 0.5 * (p + q)
+        kl_pm = np.where(p > 0, p * np.log2(p / m), 0.0).sum(axis=axis)
+        kl_qm = np.where(q > 0, q * np.log2(q / m), 0.0).sum(axis=axis)
+    out = 0.5 * (kl_pm + kl_qm)
+    empty = (ps.squeeze(axis) <= 0) | (qs.squeeze(axis) <= 0)
+    return np.where(empty, np.nan, np.clip(out, 0.0, 1.0))
+
+def trailing_sums(counts, window=WINDOW):
+    """For counts [..., days, K], the sum of the previous `window` days (excluding the day itself)."""
+    counts = np.asarray(counts, dtype=float)
+    csum = np.cumsum(counts, axis=-2)
+    pad = np.zeros_like(csum[..., :1, :])
+    csum = np.concatenate([pad, csum], axis=-2)         # csum[d] = sum of days < d
+    d = np.arange(counts.shape[-2])
+    lo = np.maximum(d - window, 0)
+    return csum[..., d, :] - csum[..., lo, :]
+
+def drift_series(counts, window=WINDOW):
+    """Vectorized JSD of each day vs its trailing window, for counts [..., days, K]."""
+    return jsd(counts, trailing_sums(counts, window))
+
+def _nan_to(v, empty):
+    return empty if np.isnan(v) else round(float(v), 6)
+
+def _history_row(date, model, counts, tox_counts, drift, tox_drift, baseline_days):
+    total = sum(counts)
+    return {"date": date, "model": model,
+            **dict(zip(CLASSES, counts)), **dict(zip(TOX_CLASSES, tox_counts)),
+            "score": round(counts[0] / total, 6) if total else "",
+            "jsd": _nan_to(drift, ""), "tox_jsd": _nan_to(tox_drift, ""),
+            "baseline_days": baseline_days}
+
+def _vec(counts, names):
+    # adaptive runs report population estimates, which need not be integers
+    return [int(round(float(counts.get(n, 0) or 0))) for n in names]
+
+class MetricsEngine:
+    def __init__(self, state_path=STATE_PATH, history_path=HISTORY_PATH, window=WINDOW, chart_days=CHART_DAYS):
+        self.state_path = state_path
+        self.history_path = history_path
+        self.window = window
+        self.keep = max(window + 1, chart_days)
+        self.state = {"window": window, "models": {}}
+        if os.path.exists(state_path):
+            with open(state_path, encoding="utf-8") as f:
+                self.state = json.load(f)
+
+    def add_day(self, date, per_model):
+        """Record one day. `per_model` = {model: {"counts": {...}, "tox_counts": {...}}}.
+
+        All models are scored in one vectorized JSD call. Re-adding the same
+        date for a model replaces that day instead of double-counting it.
+        """
+        date = normalize_date(date)
+        models = sorted(per_model)
+        today, base, tox_today, tox_base, nbase, replaced = [], [], [], [], [], set()
+        for m in models:
+            days = self.state["models"].setdefault(m, {"days": []})["days"]
+            if days and days[-1]["date"] == date:
+                days.pop()
+                replaced.add(m)
+            prev = [d for d in days if d["date"] < date][-self.window:]
+            today.append(_vec(per_model[m].get("counts", {}), CLASSES))
+            tox_today.append(_vec(per_model[m].get("tox_counts", {}), TOX_CLASSES))
+            base.append(np.sum([d["counts"] for d in prev], axis=0) if prev else [0] * len(CLASSES))
+            tox_base.append(np.sum([d["tox_counts"] for d in prev], axis=0) if prev else [0] * len(TOX_CLASSES))
+            nbase.append(len(prev))
+
+        drift = jsd(today, base) if models else []
+        tox_drift = jsd(tox_today, tox_base) if models else []
+
+        rows = []
+        for k, m in enumerate(models):
+            days = self.state["models"][m]["days"]
+            days.append({"date": date, "counts": today[k], "tox_counts": tox_today[k],
+                         "jsd": _nan_to(drift[k], None)})
+            del days[:-self.keep]
+            rows.append(_history_row(date, m, today[k], tox_today[k], drift[k], tox_drift[k], nbase[k]))
+        if replaced:
+            self._drop_tail_rows(date, replaced)
+        self._append_history(rows)
+        self.state["updated"] = date
+        return rows
+
+    def rebuild(self):
+        """Recompute every day's drift from the history file (vectorized), rewrite
+        the history without superseded rows, and reset the rolling state from it.
+        Use after changing the window or editing history by hand."""
+        history = read_history(self.history_path)
+        models, dates, counts, tox = stack_history(history)
+        drift, tox_drift = drift_series(counts, self.window), drift_series(tox, self.window)
+        rows, self.state = [], {"window": self.window, "models": {},
+                                **{k: self.state[k] for k in ("summary_sha256",) if k in self.state}}
+        for i, m in enumerate(models):
+            days = []
+            for d, date in enumerate(dates[i]):
+                c, t = [int(x) for x in counts[i, d]], [int(x) for x in tox[i, d]]
+                rows.append(_history_row(date, m, c, t, drift[i, d], tox_drift[i, d], min(d, self.window)))
+                days.append({"date": date, "counts": c, "tox_counts": t, "jsd": _nan_to(drift[i, d], None)})
+            self.state["models"][m] = {"days": days[-self.keep:]}
+        rows.sort(key=lambda r: (r["date"], r["model"]))
+        if rows:
+            self.state["updated"] = rows[-1]["date"]
+        if os.path.exists(self.history_path):
+            os.remove(self.history_path)
+        self._append_history(rows)
+        return rows
+
+    def _drop_tail_rows(self, date, models):
+        """Remove `date` rows of `models` from the end of the history file (a
+        re-run of the latest day); rows are appended in date order, so only
+        the tail is read."""
+        if not os.path.exists(self.history_path):
+            return
+        with open(self.history_path, "r+b") as f:
+            end = f.seek(0, os.SEEK_END)
+            pos, tail = end, b""
+            while pos > 0:
+                pos = max(0, pos - 65536)
+                f.seek(pos)
+                tail = f.read(end - pos)
+                lines = tail.split(b"\n")
+                # stop once a complete line before the tail has an older date
+                if pos == 0 or any(l and not l.startswith(date.encode() + b",") for l in lines[1:]):
+                    break
+            lines = tail.split(b"\n")
+            head = lines.pop(0) if pos > 0 else b""     # partial first line stays as is
+            start = pos + len(head) + (1 if pos > 0 else 0)
+            keep = []
+            for line in lines:
+                cells = next(csv.reader([line.decode("utf-8")])) if line else []
+                if len(cells) > 1 and cells[0] == date and cells[1] in models:
+                    continue
+                keep.append(line)
+            f.seek(start)
+            f.truncate()
+            f.write(b"\n".join(keep))
+
+    def _append_history(self, rows):
+        os.makedirs(os.path.dirname(os.path.abspath(self.history_path)), exist_ok=True)
+        new = not os.path.exists(self.history_path) or os.path.getsize(self.history_path) == 0
+        with open(self.history_path, "a", newline="", encoding="utf-8") as f:
+            w = csv.DictWriter(f, fieldnames=HISTORY_FIELDS)
+            if new:
+                w.writeheader()
+            w.writerows(rows)
+
+    def save(self):
+        # the history file always exists after a save (header-only before the
+        # first recorded day), so the workflow can commit it unconditionally
+        self._append_history([])
+        os.makedirs(os.path.dirname(os.path.abspath(self.state_path)), exist_ok=True)
+        tmp = self.state_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.state, f, indent=1)
+        os.replace(tmp, self.state_path)
+
+    def latest(self):
+        """metrics.json payload, built from the rolling state only."""
+        out = {"updated": self.state.get("updated"), "window": self.window, "models": {}}
+        for m, st in sorted(self.state["models"].items()):
+            days = st["days"]
+            if not days:
+                continue
+            cur, prev = days[-1], days[:-1][-self.window:]
+            base = np.sum([d["counts"] for d in prev], axis=0) if prev else np.zeros(len(CLASSES))
+            tbase = np.sum([d["tox_counts"] for d in prev], axis=0) if prev else np.zeros(len(TOX_CLASSES))
+            drift, tdrift = jsd(cur["counts"], base), jsd(cur["tox_counts"], tbase)
+            total = sum(cur["counts"])
+            out["models"][m] = {
+                "date": cur["date"],
+                "counts": dict(zip(CLASSES, cur["counts"])),
+                "distribution": {c: (n / total if total else None) for c, n in zip(CLASSES, cur["counts"])},
+                "tox_counts": dict(zip(TOX_CLASSES, cur["tox_counts"])),
+                "jsd": _nan_to(drift, None),
+                "tox_jsd": _nan_to(tdrift, None),
+                "baseline_days": len(prev),
+            }
+        return out
+
+    def chart_data(self):
+        """(models, dates, counts [models, days, K], drift [models, days]) from the
+        rolling state, left-aligned like stack_history(); days without a
+        stored drift (state written before drift was kept) give NaN."""
+        models = sorted(m for m, st in self.state["models"].items() if st["days"])
+        dates = [[d["date"] for d in self.state["models"][m]["days"]] for m in models]
+        dmax = max((len(d) for d in dates), default=0)
+        counts = np.zeros((len(models), dmax, len(CLASSES)))
+        drift = np.full((len(models), dmax), np.nan)
+        for i, m in enumerate(models):
+            for d, day in enumerate(self.state["models"][m]["days"]):
+                counts[i, d] = day["counts"]
+                drift[i, d] = np.nan if day.get("jsd") is None else day["jsd"]
+        return models, dates, counts, drift
+
+    def write_metrics_json(self, path=METRICS_JSON):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.latest(), f, indent=2)
+        return path
+
+def read_history(path=HISTORY_PATH):
+    """History as {model: (dates, counts[days, K], tox_counts[days, K])}, last write per date wins."""
+    per = {}
+    if not os.path.exists(path):
+        return {}
+    with open(path, newline="", encoding="utf-8") as f:
+        for r in csv.DictReader(f):
+            per.setdefault(r["model"], {})[r["date"]] = r
+    out = {}
+    for m, by_date in per.items():
+        dates = sorted(by_date)
+        counts = np.array([[float(by_date[d].get(c) or 0) for c in CLASSES] for d in dates])
+        tox = np.array([[float(by_date[d].get(c) or 0) for c in TOX_CLASSES] for d in dates])
+        out[m] = (dates, counts, tox)
+    return out
+
+def stack_history(history):
+    """Left-align each model's recorded days into zero-padded [models, days, K] arrays,
+    so drift_series() scores every model and day in one call (padding gives NaN)."""
+    models = sorted(history)
+    dmax = max((len(history[m][0]) for m in models), default=0)
+    counts = np.zeros((len(models), dmax, len(CLASSES)))
+    tox = np.zeros((len(models), dmax, len(TOX_CLASSES)))
+    for i, m in enumerate(models):
+        dates, c, t = history[m]
+        counts[i, :len(dates)] = c
+        tox[i, :len(dates)] = t
+    return models, [history[m][0] for m in models], counts, tox
+
+def summary_date(summary_all):
+    """Date the summary was evaluated on (latest per-model "evaluated" stamp), or None."""
+    dates = [normalize_date(s["evaluated"]) for s in summary_all.values()
+             if isinstance(s, dict) and s.get("evaluated")]
+    return max(dates) if dates else None
+
+def day_from_summary(summary_all):
+    """Turn results/summary_all.json (eval_and_publish) into add_day() input.
+    For adaptive (stratified sample) runs the population-weighted counts are used."""
+    return {m: {"counts": s["adaptive"]["estimated_counts"] if "adaptive" in s else s.get("counts", {}),
+                "tox_counts": {k: v for k, v in s.get("toxicity", {}).get("counts", {}).items() if k in TOX_CLASSES}}
+            for m, s in summary_all.items()}
@@ -1,17 +1,19 @@
-import matplotlib.pyplot as plt
-import numpy as np
+import os, sys
 
-# Dummy data for 8 days (replace with your real JSD values if available)
-dates = [f"Day {i}" for i in range(1, 9)]
-jsd = np.random.uniform(0, 0.2, size=8)  # Random JSD values
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+from metrics.engine import MetricsEngine
+from metrics.charts import render, drift_job
 
-plt.figure(figsize=(8,4))
-plt.plot(dates, jsd, marker='o', linewidth=2, color='tab:blue')
-plt.title("Drift Index (Jensen–Shannon Divergence vs 7-day average)")
-plt.xlabel("Date")
-plt.ylabel("JSD (0–1)")
-plt.ylim(0, 1)
-plt.tight_layout()
-plt.grid(True, alpha=0.3)
-plt.savefig("results/drift_index.png")
-plt.close()
+# Real JSD of each day's class distribution vs the trailing 7 days, per model,
+# from the rolling state in metrics/state.json (written by
+# metrics/compute_metrics.py). The PNG is only redrawn when that changed.
+def main():
+    engine = MetricsEngine()
+    models, dates, _, drift = engine.chart_data()
+    render([drift_job(models, dates, drift, engine.window,
+                      out_png=os.path.join("results", "drift_index.png"))])
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+# tests/test_run_benchmark_args.py
+# Smoke test of run_benchmark's flag combinations: parsing only, no model is loaded.
+
+import os, sys
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+from benchmark.run_benchmark import parse_args
+
+REJECTED = [
+    (["--gen_cache", "c.sqlite"], "--gen_cache requires --seed"),
+    (["--models", "a,b", "--model_name", "gpt2"], "--model_name not supported with --models"),
+    (["--models", "a,b", "--model_revision", "main"], "--model_revision not supported with --models"),
+    (["--models", "a,b", "--output_path", "x.csv"], "--output_path not supported with --models"),
+    (["--models", "a,b", "--workers", "2"], "--workers not supported with --models"),
+    (["--models", "a,b", "--daemon", "on"], "--daemon on not supported with --models"),
+    (["--models", "a,b", "--quantize", "int8", "--greedy"], "--quantize, --greedy not supported with --models"),
+    (["--models", "a,b", "--adaptive"], "--adaptive not supported with --models"),
+    (["--early_stop", "--workers", "2"], "--workers not supported with --early_stop"),
+    (["--early_stop", "--daemon", "on"], "--daemon on not supported with --early_stop"),
+    (["--adaptive", "--workers", "2"], "--workers not supported with --adaptive"),
+    (["--assistant_model", "d", "--prefix_cache"], "--prefix_cache not supported with --assistant_model"),
+    (["--assistant_model", "d", "--early_stop"], "--early_stop not supported with --assistant_model"),
+    (["--greedy", "--daemon", "on"], "--daemon on not supported with --quantize / --greedy"),
+    (["--batch_size", "4", "--daemon", "on"], "--batch_size not supported with --daemon on"),
+    (["--tox_band", "0.1,0.9"], "--tox_band requires --tox_cascade"),
+    (["--tox_cascade", "c.json", "--tox_band", "0.9,0.1"], "--tox_band needs 0 <= lo <= hi <= 1"),
+    (["--tox_cascade", "c.json", "--tox_band", "low"], "--tox_band must be lo,hi"),
+]
+
+@pytest.mark.parametrize("argv,message", REJECTED)
+def test_rejected(argv, message, capsys):
+    with pytest.raises(SystemExit) as e:
+        parse_args(argv)
+    assert e.value.code == 2
+    assert message in capsys.readouterr().err
+
+def test_defaults():
+    args = parse_args([])
+    assert args.daemon == "auto" and args.local_gen_flags == []
+    assert args.output_path.endswith(os.path.join("results", "distilgpt2_outputs.csv"))
+
+@pytest.mark.parametrize("argv", [["--models", "a,b@main"], ["--early_stop"], ["--assistant_model", "d"],
+                                  ["--quantize", "int8"], ["--greedy"]])
+def test_local_modes_turn_the_daemon_off(argv):
+    assert parse_args(argv).daemon == "off"
+
+def test_accepted():
+    args = parse_args(["--early_stop", "unsafe,refusal", "--tox_cascade", "c.json", "--tox_band", "0.2,0.8",
+                       "--batch_size", "4", "--seed", "0", "--gen_cache", "c.sqlite"])
+    assert args.early_stop == ("unsafe", "refusal")
+    assert args.tox_band == (0.2, 0.8)
+    assert args.local_gen_flags == ["--batch_size"]